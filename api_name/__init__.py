@@ -1 +1,6 @@
 __version__ = '1.1.20'
+
+import logging
+
+# Library logging is opt-in (see api_name.log.configure_logging)
+logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -0,0 +1,311 @@
+# -*- encoding:utf8 -*-
+
+import asyncio
+import logging
+
+try:
+    import aiohttp
+except ImportError: # pragma: no cover - optional dependency
+    aiohttp = None
+
+from api_name.api import (API_URL, API_USER, API_TOKEN, GET, POST,
+    TIMEOUT_RETRY_SECONDS, MAX_TIMEOUT_RETRIES, MAX_DELETE_RETRIES,
+    DNSRecord, RecordSet, parse_result)
+from api_name.codec import default_codec
+from api_name.log import request_fields
+from api_name.retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+# Default max number of requests in flight per client
+CONCURRENCY = 10
+
+
+class AsyncAPIName(object):
+    """
+        Asyncio flavour of APIName. Same public surface and result
+        semantics, but every method is a coroutine, requests go through
+        an aiohttp session and retry delays do not block the event loop.
+        Concurrent requests are bounded by a semaphore.
+        Public methods:
+         * list_dns_records
+         * delete_dns_record
+         * update_dns_record
+         * create_dns_record
+         * update_nameservers
+         * get_domain
+         * close
+        Private methods:
+         * _do_request
+    """
+
+    def __init__(self, url=API_URL, username=API_USER, token=API_TOKEN,
+            concurrency=CONCURRENCY, session=None, retry=None,
+            rate_limiter=None, codec=None):
+        """
+            Initializes base url, authentication headers and concurrency
+            limit. The aiohttp session is created on first request unless
+            one is supplied
+             * concurrency (int) = max requests in flight (10)
+             * session (aiohttp.ClientSession) = http session (None)
+             * retry (RetryPolicy) = timeouts, backoff and deadline
+             * rate_limiter (TokenBucket) = opt-in client side rate limit
+             * codec (JSONCodec) = json backend (fastest installed)
+        """
+        if aiohttp is None:
+            raise ImportError(u"AsyncAPIName requires aiohttp: "
+                "pip install api_name[async]")
+        self.base_url = url
+        self.headers = {'Api-Username': username, 'Api-Token': token}
+        self.concurrency = concurrency
+        self.retry = retry or RetryPolicy(max_attempts=MAX_TIMEOUT_RETRIES,
+            max_backoff=TIMEOUT_RETRY_SECONDS)
+        self.rate_limiter = rate_limiter
+        self.codec = codec or default_codec
+        self._semaphore = None
+        self._owns_conn = session is None
+        self.conn = session
+
+    def __str__(self):
+        """
+            AsyncAPIName unicode representation
+        """
+        return u"%s (%s)" % (self.base_url, self.headers['Api-Username'])
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """
+            Close the http session (only if owned)
+        """
+        if self.conn is not None and self._owns_conn:
+            await self.conn.close()
+            self.conn = None
+
+    def _session(self):
+        """
+            Return http session, creating it lazily inside the loop
+        """
+        if self.conn is None:
+            _connector = aiohttp.TCPConnector(limit=self.concurrency)
+            self.conn = aiohttp.ClientSession(connector=_connector)
+        return self.conn
+
+    def _slots(self):
+        """
+            Return the concurrency semaphore, creating it lazily inside
+            the loop (before Python 3.10 it binds to the loop current at
+            creation)
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def _do_request(self, url, method=GET, payload=None, deadline=None,
+            idempotent=True):
+        """
+            Perform an http request, retrying timeouts and retryable
+            statuses as the retry policy says, without blocking the loop.
+            * Args:
+             - url (string): API url to check (full url)
+             - method (const string): GET or POST method
+             - payload (dict): payload for post request
+             - deadline (Deadline): budget shared with caller retries
+             - idempotent (bool): retry retryable statuses too (True)
+            * Output:
+             - content (bytes): body of a successful response
+             - None: error in request
+        """
+        params = {'headers': self.headers}
+        if payload:
+            params['data'] = self.codec.dumps(payload)
+
+        _policy = self.retry
+        _deadline = deadline or _policy.start()
+        _attemp = 0
+        while True:
+            _attemp += 1
+            _timeout = _policy.timeout(_deadline)
+            if _timeout is None:
+                logger.error(u"Deadline exceeded getting %s", url,
+                    extra=request_fields(method, url, _attemp))
+                return None
+            if not await self._acquire(_deadline):
+                logger.error(u"Rate limit wait exceeds deadline getting %s", url,
+                    extra=request_fields(method, url, _attemp))
+                return None
+            response = None
+            try:
+                async with self._slots():
+                    async with self._session().request(method.upper(), url,
+                            timeout=aiohttp.ClientTimeout(connect=_timeout[0],
+                                sock_read=_timeout[1]),
+                            **params) as response:
+                        _content = await response.read()
+                if response.status == 200:
+                    return _content
+                if not _policy.should_retry(response.status, idempotent):
+                    break
+                logger.warning(u"Error %s getting %s, retry...",
+                    response.status, url, extra=request_fields(method, url,
+                        _attemp, response.status))
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+                logger.warning(u"Timeout error getting %s, retry...", url,
+                    extra=request_fields(method, url, _attemp))
+            if _attemp >= _policy.max_attempts:
+                logger.error(u"Max retries getting %s", url,
+                    extra=request_fields(method, url, _attemp))
+                break
+            _delay = _policy.delay(_attemp, response)
+            if not _policy.fits(_delay, _deadline):
+                logger.error(u"Deadline exceeded getting %s", url,
+                    extra=request_fields(method, url, _attemp))
+                break
+            await asyncio.sleep(_delay)
+
+        if response is not None:
+            logger.error(u"Error %s in request %s %s: %s", response.status,
+                method.upper(), url, response.reason,
+                extra=request_fields(method, url, _attemp, response.status))
+        return None
+
+    async def _acquire(self, deadline):
+        """
+            Wait (without blocking the loop) for a rate limiter token
+            * Output:
+             - True (bool): token taken (or no limiter)
+             - False (bool): wait would exceed the deadline
+        """
+        if self.rate_limiter is None:
+            return True
+        while True:
+            _wait = self.rate_limiter.reserve()
+            if not _wait:
+                return True
+            if not self.retry.fits(_wait, deadline):
+                return False
+            await asyncio.sleep(_wait)
+
+    def _postprocess(self, content, method_name):
+        """
+            Check result code of a response body (see parse_result)
+        """
+        if content:
+            return parse_result(content, method_name, codec=self.codec)
+        return False
+
+    async def get_dns_record(self, domain, record_id):
+        """
+            Retrieve dns record from a record_id given
+        """
+        return (await self.list_dns_records(domain)).get(record_id)
+
+    async def find_dns_record(self, domain, content):
+        """
+            Find dns records from a domain given which match content
+        """
+        return (await self.list_dns_records(domain)).find(content=content)
+
+    async def list_dns_records(self, domain):
+        """
+            Find all dns records from a domain given
+            * Output:
+             - records (RecordSet): indexed domain dns records
+        """
+        _result = await self._do_request(self.base_url + "/dns/list/%s" % domain)
+        _data = self._postprocess(_result, 'list_dns_records')
+        if not _data:
+            return RecordSet()
+        return RecordSet.from_rows(domain, _data[u'records'])
+
+    async def delete_dns_record(self, domain, record_id):
+        """
+            Delete a domain dns record given a record_id
+            * Output:
+             - True (bool): record was deleted
+             - False (bool): there was an error in process
+        """
+        _iter = 0
+        _deadline = self.retry.start()
+        while True:
+            _result = await self._do_request(
+                self.base_url + "/dns/delete/%s" % domain, POST,
+                {'record_id': record_id}, _deadline)
+            if self._postprocess(_result, 'delete_dns_record'):
+                return True
+            _fields = {'action': 'delete_dns_record', 'domain': domain,
+                'attempt': _iter + 1}
+            logger.warning('Try to delete %s record id, retrying...', record_id,
+                extra=_fields)
+            if _iter >= MAX_DELETE_RETRIES:
+                logger.error('Max retries deleting %s record id.', record_id,
+                    extra=_fields)
+                return False
+            _iter += 1
+            _delay = self.retry.delay(_iter)
+            if not self.retry.fits(_delay, _deadline):
+                logger.error('Deadline exceeded deleting %s record id.',
+                    record_id, extra=_fields)
+                return False
+            await asyncio.sleep(_delay)
+
+    async def create_dns_record(self, domain, record):
+        """
+            Create a new dns record given a DNSRecord instance.
+            * Output:
+             - DNSRecord: record was properly created
+             - False (bool): record was not created (error thown)
+        """
+        _result = await self._do_request(
+            self.base_url + "/dns/create/%s" % domain, POST, record.post_data(),
+            idempotent=False)
+        _data = self._postprocess(_result, 'create_dns_record')
+        if _data:
+            return DNSRecord.create_from_raw(_data, domain)
+        return False
+
+    async def update_dns_record(self, domain, content, record):
+        """
+            Update a dns record for a domain given: delete the records
+            matching content, then create the new one
+        """
+        _zone = await self.list_dns_records(domain)
+        _found = _zone.find(content=content)
+        if _found:
+            if len(_found) > 1:
+                _found = _zone.find(hostname=record.hostname, content=content)
+            await asyncio.gather(*[self.delete_dns_record(domain,
+                _rec.record_id) for _rec in _found])
+            await asyncio.sleep(0.4)
+        return await self.create_dns_record(domain, record)
+
+    async def update_nameservers(self, domain, nameservers):
+        """
+            Update nameservers, setting param list as default nameservers
+            * Output
+             - True (bool): default nameservers updated
+             - False (bool): there was an error in process
+        """
+        _url = self.base_url + '/domain/update_nameservers/' + domain
+        _result = await self._do_request(_url, POST, {'nameservers': nameservers})
+        return bool(self._postprocess(_result, 'update_nameservers'))
+
+    async def get_domain(self, domain, check=True):
+        """
+            Retrieve domain info. Check if a domain exists by default
+            * Output:
+             - False (bool): domain was not found
+             - True (bool): domain was found (check = True)
+             - data (dict): domain info (check = False)
+        """
+        _result = await self._do_request(self.base_url + "/domain/get/%s" % domain)
+        _data = self._postprocess(_result, 'get_domain')
+        if not _data:
+            return False
+        if check:
+            return True
+        return _data
@@ -1,38 +1,95 @@
 # -*- encoding:utf8 -*-
 
-from requests import get, post
-from requests.exceptions import Timeout, ConnectionError
-from json import loads, dumps
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import time
 
+from api_name.transport import HTTPTransport, TransportError, POOL_SIZE
+from api_name.codec import default_codec
+from api_name import batch, stream, sync, watcher, writebehind
+from api_name.log import request_fields
+from api_name.metrics import RequestEvent, observed
+from api_name.retry import RetryPolicy
+from api_name.singleflight import SingleFlight
+
+# Defaults of the retry policy: max backoff delay and attempts
 TIMEOUT_RETRY_SECONDS = 2
 MAX_TIMEOUT_RETRIES = 3
 MAX_DELETE_RETRIES = 3
-logging.basicConfig(level=logging.INFO)
-handler = logging.FileHandler('/tmp/apiname.log')
 logger = logging.getLogger(__name__)
-logger.addHandler(handler)
 
 # Methods allowed
 GET = 'get'
 POST = 'post'
-METHODS = {GET: get, POST: post}
+METHODS = (GET, POST)
+
+# name.com result code of objects that do not exist
+CODE_NOT_FOUND = 251
+# Default parallelism of bulk domain lookups
+DOMAIN_WORKERS = 8
 
 # Base API url
 API_URL = 'https://api.name.com/api'
+# Development (test) API url
+DEV_API_URL = 'https://api.dev.name.com/api'
 # Default API user
 API_USER = None
 # Default API token
 API_TOKEN = None
 
+def parse_result(content, method_name, notify=None, codec=None):
+    """
+        Decode a name.com response body and check its result code.
+        Shared by every client flavour (sync and async)
+        * Args:
+         - content (bytes): raw response body
+         - method_name (string): ancestor method (for logging)
+         - notify (callable): called with (method_name, result code)
+         - codec (JSONCodec): json backend (fastest installed)
+        * Output:
+         - data (dict): response data (result envelope removed)
+         - True (bool): successful response without data
+         - False (bool): error in response
+    """
+    _result = (codec or default_codec).loads(content)
+    if not check_result(_result.pop('result'), method_name, notify):
+        return False
+    if not _result:
+        return True
+    return _result
+
+def check_result(respdict, method_name, notify=None):
+    """
+        Check the result envelope ({'code': .., 'message': ..}) of a
+        name.com response, logging errors
+        * Output:
+         - True (bool): successful response
+         - False (bool): error in response
+    """
+    if notify is not None:
+        notify(method_name, respdict['code'])
+    if respdict['code'] == 100:
+        return True
+    elif respdict['code'] == 204:
+        if method_name == 'delete_dns_record':
+            return True
+    logger.error(u"Error %s in %s method: %s", respdict['code'], method_name,
+        respdict['message'], extra={'action': method_name,
+            'code': respdict['code']})
+    return False
+
 class DNSRecord(object):
     """
         DNS Record model. Describes default values of a record
         in dns infraestructure, and provides a valid json describing
-        the record
+        the record. Records are immutable and compared by value, so
+        they can be hashed, used in sets and shared between threads
     """
 
+    __slots__ = ('record_id', 'domain', 'hostname', 'rtype', 'content', 'ttl',
+        'priority', 'create_date')
+
     def __init__(self, domain=None, hostname=None, rtype='CNAME', content=None,
             ttl=300, priority=None, record_id=None, create_date=None):
         """
@@ -46,14 +103,44 @@ class DNSRecord(object):
              * priority (int) = Default priority (Null)
              * create_date (date) = Record created date
         """
-        self.record_id = record_id
-        self.domain = domain
-        self.hostname = hostname
-        self.rtype = rtype
-        self.content = content
-        self.ttl = ttl
-        self.priority = priority
-        self.create_date = create_date
+        _set = object.__setattr__
+        _set(self, 'record_id', record_id)
+        _set(self, 'domain', domain)
+        _set(self, 'hostname', hostname)
+        _set(self, 'rtype', rtype)
+        _set(self, 'content', content)
+        _set(self, 'ttl', ttl)
+        _set(self, 'priority', priority)
+        _set(self, 'create_date', create_date)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(u"DNSRecord is immutable, use replace()")
+
+    def __delattr__(self, name):
+        raise AttributeError(u"DNSRecord is immutable, use replace()")
+
+    def _values(self):
+        return (self.record_id, self.domain, self.hostname, self.rtype,
+            self.content, self.ttl, self.priority, self.create_date)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __ne__(self, other):
+        _equal = self.__eq__(other)
+        return _equal if _equal is NotImplemented else not _equal
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __reduce__(self):
+        return (_record_from_values, (self._values(),))
+
+    def __repr__(self):
+        return u"DNSRecord(%s)" % u", ".join(u"%s=%r" % (_name, _value)
+            for _name, _value in zip(self.__slots__, self._values()))
 
     def __str__(self):
         """
@@ -61,6 +148,14 @@ class DNSRecord(object):
         """
         return u"%s.%s (%s)" % (self.hostname, self.domain, self.rtype)
 
+    def replace(self, **changes):
+        """
+            Return a copy of the record with the fields given changed
+        """
+        _fields = dict(zip(self.__slots__, self._values()))
+        _fields.update(changes)
+        return DNSRecord(**_fields)
+
     def post_data(self):
         """
             Return a valid dict for creating dns record in name API
@@ -76,10 +171,10 @@ class DNSRecord(object):
             'content': self.content, 'ttl': self.ttl, 'type': self.rtype}
 
     @staticmethod
-    def create_from_raw(raw_dict):
+    def create_from_raw(raw_dict, domain=None):
         """
             Creates a new DNSRecord instance given a raw dict with field values.
-            Key value map is:
+            The dict is not modified. Key value map is:
              domain (string): record domain
              record_id (int): unique ID
              name (string): subdomain.domain.com
@@ -87,14 +182,239 @@ class DNSRecord(object):
              content (string): DNS record content
              ttl (string): DNS record TTL
              priority (string): DNS record priority
-             updated_date (string): last update record date
+             create_date (string): record creation date
             * Args
              - raw_dict (dict): dict with key value map
+             - domain (string): record domain, overrides raw_dict one
             * Outuput
+             - record (DNSRecord)
+        """
+        _get = raw_dict.get
+        return DNSRecord(domain or _get('domain'), _get('name'),
+            _get('type'), _get('content'), _get('ttl'), _get('priority'),
+            _get('record_id'), _get('create_date'))
+
+    @classmethod
+    def from_rows(cls, domain, rows):
+        """
+            Decode the 'records' rows of a list response in one pass,
+            without modifying nor copying them
+            * Args:
+             - domain (string): zone domain
+             - rows (list): raw record dicts
+            * Output:
+             - records (generator): DNSRecord per row
+        """
+        _new = object.__new__
+        _set_id, _set_domain, _set_host, _set_type, _set_content, _set_ttl, \
+            _set_prio, _set_date = [getattr(cls, _name).__set__
+                for _name in cls.__slots__]
+        for row in rows:
+            _get = row.get
+            _record = _new(cls)
+            _set_id(_record, _get('record_id'))
+            _set_domain(_record, domain)
+            _set_host(_record, _get('name'))
+            _set_type(_record, _get('type'))
+            _set_content(_record, _get('content'))
+            _set_ttl(_record, _get('ttl'))
+            _set_prio(_record, _get('priority'))
+            _set_date(_record, _get('create_date'))
+            yield _record
+
+
+def _record_from_values(values):
+    """
+        Rebuild a pickled DNSRecord
+    """
+    _record = object.__new__(DNSRecord)
+    for _name, _value in zip(DNSRecord.__slots__, values):
+        object.__setattr__(_record, _name, _value)
+    return _record
+
+class RecordSet(object):
+    """
+        Collection of DNSRecord instances indexed by record_id, hostname,
+        content and rtype. Indexes are built once, so lookups (also
+        compound ones like hostname + rtype) do not scan the whole zone.
+        Behaves as a read only sequence of records. Copies share index
+        buckets until one of them changes a bucket, so copying a large
+        zone to change a record is cheap.
+        Public methods:
+         * get
+         * find
+         * add
+         * remove
+         * copy
+    """
+
+    # Record attributes with a secondary index
+    INDEXES = ('hostname', 'content', 'rtype')
+
+    def __init__(self, records=()):
+        """
+            Build indexes for records given
+             * records (iterable) = DNSRecord instances
+        """
+        self._records = {}
+        self._by_id = {}
+        self._index = dict((_attr, {}) for _attr in self.INDEXES)
+        self._seq = 0
+        self._list = None
+        # Buckets (attr, value) copied since the last copy(), None when
+        # no bucket is shared with another RecordSet
+        self._owned = None
+        for _record in records:
+            self.add(_record)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records.values())
+
+    def __getitem__(self, pos):
+        if self._list is None:
+            self._list = list(self._records.values())
+        return self._list[pos]
+
+    def __contains__(self, record):
+        return any(_rec is record or _rec == record
+            for _rec in self._candidates(record.hostname, 'hostname'))
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return u"RecordSet(%d records)" % len(self)
+
+    @classmethod
+    def from_rows(cls, domain, rows):
+        """
+            Build a RecordSet from the raw 'records' rows of a list response
+            * Args:
+             - domain (string): zone domain
+             - rows (list): raw record dicts
+        """
+        return cls(DNSRecord.from_rows(domain, rows))
+
+    def _candidates(self, value, attr):
+        """
+            Return records (as {key: record}) indexed under attr value
+        """
+        return self._index[attr].get(value, {}).values()
+
+    def get(self, record_id):
+        """
+            Return the record with record_id given or None
+        """
+        _key = self._by_id.get(record_id)
+        if _key is None:
+            return None
+        return self._records[_key]
+
+    def find(self, hostname=None, rtype=None, content=None):
+        """
+            Return records matching every criteria given
+            * Args:
+             - hostname (string): record hostname
+             - rtype (string): record type
+             - content (string): record content
+            * Output:
+             - records (Array): matched records, in zone order
+        """
+        _criteria = [(_attr, _value) for _attr, _value in
+            (('hostname', hostname), ('rtype', rtype), ('content', content))
+            if _value is not None]
+        if not _criteria:
+            return list(self)
+        _buckets = [self._index[_attr].get(_value, {})
+            for _attr, _value in _criteria]
+        _buckets.sort(key=len)
+        _smallest, _others = _buckets[0], _buckets[1:]
+        return [_rec for _key, _rec in _smallest.items()
+            if all(_key in _bucket for _bucket in _others)]
+
+    def add(self, record):
         """
-        raw_dict['rtype'] = raw_dict.pop('type') # Remap type to rtype
-        raw_dict['hostname'] = raw_dict.pop('name') # Remap name to hostname
-        return DNSRecord(**raw_dict)
+            Add a record, updating every index
+        """
+        _key = self._seq
+        self._seq += 1
+        self._records[_key] = record
+        if record.record_id is not None:
+            _old = self._by_id.get(record.record_id)
+            if _old is not None:
+                self._drop(_old)
+            self._by_id[record.record_id] = _key
+        for _attr in self.INDEXES:
+            self._bucket(_attr, getattr(record, _attr), True)[_key] = record
+        self._list = None
+
+    def remove(self, record_id):
+        """
+            Remove a record given its record_id
+            * Output:
+             - record (DNSRecord): removed record
+             - None: record_id not found
+        """
+        _key = self._by_id.pop(record_id, None)
+        if _key is None:
+            return None
+        return self._drop(_key)
+
+    def _drop(self, key):
+        """
+            Remove record stored under internal key from every index
+        """
+        _record = self._records.pop(key)
+        for _attr in self.INDEXES:
+            _bucket = self._bucket(_attr, getattr(_record, _attr))
+            if _bucket is not None:
+                _bucket.pop(key, None)
+                if not _bucket:
+                    del self._index[_attr][getattr(_record, _attr)]
+        self._list = None
+        return _record
+
+    def _bucket(self, attr, value, create=False):
+        """
+            Return the index bucket of attr value, copied first if it is
+            shared with another RecordSet
+            * Output:
+             - bucket (dict): {key: record} this set may change
+             - None: no bucket and create is False
+        """
+        _index = self._index[attr]
+        _bucket = _index.get(value)
+        if _bucket is None:
+            if not create:
+                return None
+            _bucket = _index[value] = {}
+        elif self._owned is not None and (attr, value) not in self._owned:
+            _bucket = _index[value] = dict(_bucket)
+        if self._owned is not None:
+            self._owned.add((attr, value))
+        return _bucket
+
+    def copy(self):
+        """
+            Return a new RecordSet with the same records. Index buckets
+            are shared, and copied by whichever set changes them first
+        """
+        _copy = self.__class__.__new__(self.__class__)
+        _copy._records = dict(self._records)
+        _copy._by_id = dict(self._by_id)
+        _copy._index = dict((_attr, dict(_values))
+            for _attr, _values in self._index.items())
+        _copy._seq = self._seq
+        _copy._list = self._list
+        _copy._owned = set()
+        self._owned = set()
+        return _copy
 
 class APIName(object):
     """
@@ -106,21 +426,73 @@ class APIName(object):
          - Update dns records
         Public methods:
          * list_dns_records
+         * iter_dns_records
          * delete_dns_record
          * update_dns_record
          * create_dns_record
+         * get_domains
+         * apply_batch
+         * sync_zone
+         * watch_zones
+         * write_behind
+         * close
         Private methods:
          * _do_request
+         * _get_zone
+         * _stored_zone
+         * _fetch_zone
+         * _lookup_domain
+         * _fetch_domain
     """
 
     conn = None
 
-    def __init__(self, url=API_URL, username=API_USER, token=API_TOKEN):
+    def __init__(self, url=API_URL, username=API_USER, token=API_TOKEN,
+            transport=None, pool_size=POOL_SIZE, cache=None, retry=None,
+            rate_limiter=None, observers=None, coalesce=False, store=None,
+            domain_cache=None, codec=None):
         """
-            Initializes base url and creates authentication headers
+            Initializes base url and creates authentication headers.
+            Every instance owns a pooled keep-alive transport unless
+            one is supplied (it can be shared between instances)
+             * transport (HTTPTransport) = http transport (None)
+             * pool_size (int) = connection pool size (10)
+             * cache (ZoneCache) = opt-in zone cache (None)
+             * retry (RetryPolicy) = timeouts, backoff and deadline
+             * rate_limiter (TokenBucket) = opt-in client side rate limit
+             * observers (list) = Observer hooks, e.g. MetricsCollector
+             * coalesce (bool) = share concurrent identical reads (False)
+             * store (ZoneStore) = opt-in on-disk zone snapshots (None)
+             * domain_cache (DomainCache) = opt-in domain info cache,
+               missing domains included (None)
+             * codec (JSONCodec) = json backend (fastest installed)
         """
         self.base_url = url
         self.headers = {'Api-Username': username, 'Api-Token': token}
+        self.cache = cache
+        self.store = store
+        self.domain_cache = domain_cache
+        self.codec = codec or default_codec
+        self.retry = retry or RetryPolicy(max_attempts=MAX_TIMEOUT_RETRIES,
+            max_backoff=TIMEOUT_RETRY_SECONDS)
+        self.rate_limiter = rate_limiter
+        self.observers = list(observers or ())
+        self.flights = SingleFlight() if coalesce else None
+        self._owns_conn = transport is None
+        self.conn = transport or HTTPTransport(pool_size=pool_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+            Release pooled connections (only if transport is owned)
+        """
+        if self.conn is not None and self._owns_conn:
+            self.conn.close()
 
     def __str__(self):
         """
@@ -140,58 +512,132 @@ class APIName(object):
              - None: error in response
         """
         if response:
-            _result = loads(response.content)
-            _respdict = _result.pop('result')
-            if _respdict['code'] == 100:
-                if not _result:
-                    return True
-                return _result
-            elif _respdict['code'] == 204:
-                if method_name == 'delete_dns_record':
-                    return True
-            _msg = u"Error %s in %s method: %s" % (_respdict['code'], method_name, _respdict['message'])
-            logger.error(_msg)
+            return parse_result(response.content, method_name,
+                self._notify_result if self.observers else None, self.codec)
         return False
 
-    def _do_request(self, url, method=GET, payload=None):
+    def _notify_result(self, method_name, code):
+        self._emit('on_result', method_name, code)
+
+    def _emit(self, hook, *args):
+        """
+            Call hook on every observer
+        """
+        for _observer in self.observers:
+            getattr(_observer, hook)(*args)
+
+    def _endpoint(self, url):
+        """
+            Return API endpoint of an url (/dns/list, /domain/get, ...)
+        """
+        if url.startswith(self.base_url):
+            url = url[len(self.base_url):]
+        return url.rsplit('/', 1)[0]
+
+    def _do_request(self, url, method=GET, payload=None, deadline=None,
+            stream=False, action=None, idempotent=True):
         """
             Wrapper for requests get/post methods.
-            This method takes care of requests errors.
+            This method takes care of requests errors, retrying timeouts
+            and retryable statuses as the retry policy says.
             * Args:
              - url (string): API url to check (full url)
              - method (const string): GET or POST method
              - data (dict): payload for post request
+             - deadline (Deadline): budget shared with caller retries
+             - stream (bool): do not read the body in advance (False)
+             - action (string): public method issuing it (for observers)
+             - idempotent (bool): retry retryable statuses too (True)
             * Output:
              - result (Response): response of request
         """
+        if not self.observers:
+            return self._send(url, method, payload, deadline, stream,
+                idempotent)[0]
+        _start = time.time()
+        _response, _attempts, _slept, _status = self._send(url, method,
+            payload, deadline, stream, idempotent)
+        _size = None
+        if _response is not None:
+            if stream:
+                _size = _response.headers.get('Content-Length')
+                _size = int(_size) if _size else None
+            else:
+                _size = len(_response.content)
+        self._emit('on_request', RequestEvent(action, self._endpoint(url),
+            method.upper(), _status, time.time() - _start, _attempts, _slept,
+            _size))
+        return _response
+
+    def _send(self, url, method, payload, deadline, stream, idempotent=True):
+        """
+            Request loop of _do_request
+            * Output:
+             - (response, attempts, slept, status_code): response is None
+               on error, slept are seconds waited between attempts
+        """
         params = {'headers': self.headers}
         if payload:
-            params['data'] = dumps(payload)
+            params['data'] = self.codec.dumps(payload)
 
+        _policy = self.retry
+        _deadline = deadline or _policy.start()
         _attemp = 0
-        while _attemp < MAX_TIMEOUT_RETRIES:
+        _slept = 0.0
+        response = None
+        while True:
+            _attemp += 1
+            _timeout = _policy.timeout(_deadline)
+            if _timeout is None:
+                logger.error(u"Deadline exceeded getting %s", url,
+                    extra=request_fields(method, url, _attemp))
+                return None, _attemp, _slept, None
+            if self.rate_limiter is not None and not \
+                    self.rate_limiter.acquire(timeout=_deadline.remaining()):
+                logger.error(u"Rate limit wait exceeds deadline getting %s", url,
+                    extra=request_fields(method, url, _attemp))
+                return None, _attemp, _slept, None
+            response = None
             try:
-                response = METHODS[method](url, **params)
+                response = self.conn.request(method, url, timeout=_timeout,
+                    stream=stream, **params)
+            except TransportError:
+                logger.warning(u"Timeout error getting %s, retry...", url,
+                    extra=request_fields(method, url, _attemp))
+            else:
+                if response.status_code == 200:
+                    return response, _attemp, _slept, 200
+                if stream:
+                    # Give the connection back to the pool, status code,
+                    # reason and headers are still readable
+                    response.close()
+                if not _policy.should_retry(response.status_code, idempotent):
+                    break
+                logger.warning(u"Error %s getting %s, retry...",
+                    response.status_code, url, extra=request_fields(method,
+                        url, _attemp, response.status_code))
+            if _attemp >= _policy.max_attempts:
+                logger.error(u"Max retries getting %s", url,
+                    extra=request_fields(method, url, _attemp))
                 break
-            except (Timeout, ConnectionError):
-                logger.warn(u"Timeout error getting %s, retry...", url)
-                _attemp += 1
-                time.sleep(TIMEOUT_RETRY_SECONDS)
-            if _attemp >= MAX_TIMEOUT_RETRIES:
-                logger.error(u"Max retries getting %s", url)
-                return None
+            _delay = _policy.delay(_attemp, response)
+            if not _policy.wait(_delay, _deadline):
+                logger.error(u"Deadline exceeded getting %s", url,
+                    extra=request_fields(method, url, _attemp))
+                break
+            _slept += _delay
 
-        if response and response.status_code == 200:
-            return response
-        try:
-            _msg = u"Error %s in request %s %s: %s" % (response.status_code,
-                method.upper(), url, response.content)
-        except UnicodeDecodeError:
-            _msg = u"Error %s in request %s %s: %s" % (response.status_code,
-                method.upper(), url, response.reason)
-        logger.error(_msg)
-        return None
+        if response is None:
+            return None, _attemp, _slept, None
+        if logger.isEnabledFor(logging.ERROR):
+            logger.error(u"Error %s in request %s %s: %r",
+                response.status_code, method.upper(), url,
+                response.content if not stream else response.reason,
+                extra=request_fields(method, url, _attemp,
+                    response.status_code))
+        return None, _attemp, _slept, response.status_code
 
+    @observed
     def get_dns_record(self, domain, record_id):
         """
             Retrieve dns record from a record_id given
@@ -201,12 +647,9 @@ class APIName(object):
              - None: No record was found or error
              - record (DNSRecord): dns record matched
         """
-        records = self.list_dns_records(domain)
-        for record in records:
-            if record.record_id == record_id:
-                return record
-        return None
+        return self.list_dns_records(domain).get(record_id)
 
+    @observed
     def find_dns_record(self, domain, content):
         """
             Find a dns record from a domain given which matchs with content
@@ -217,13 +660,9 @@ class APIName(object):
              - None: No record was found or error
              - record (DNSRecord): dns record matched
         """
-        _records = self.list_dns_records(domain)
-        _result = []
-        for _record in _records:
-            if content == _record.content:
-                _result.append(_record)
-        return _result
+        return self.list_dns_records(domain).find(content=content)
 
+    @observed
     def list_dns_records(self, domain):
         """
             Find all dns records from a domain given or
@@ -231,18 +670,141 @@ class APIName(object):
             * Args:
              - domain (string): valid domain from name.com
             * Output:
-             - records (Array): list of domain dns records
+             - records (RecordSet): indexed domain dns records. When cache
+               is enabled the set is shared with it; do not modify it
+        """
+        _records = self._get_zone(domain)
+        if _records is None:
+            return RecordSet()
+        return _records
+
+    def _get_zone(self, domain):
+        """
+            Return domain records from cache or API. Unlike
+            list_dns_records, an error is told apart from an empty zone
+            * Output:
+             - records (RecordSet): indexed domain dns records
+             - None: error retrieving records
         """
-        _result = self._do_request(self.base_url + "/dns/list/%s" % domain)
+        if self.cache is not None:
+            _cached = self.cache.get(domain)
+            if _cached is not None:
+                return _cached
+        _stored = self._stored_zone(domain)
+        if _stored is not None:
+            return _stored
+        if self.flights is not None:
+            return self.flights.do(('/dns/list', domain), self._fetch_zone,
+                domain)
+        return self._fetch_zone(domain)
+
+    def _stored_zone(self, domain):
+        """
+            Return domain records from a fresh store snapshot (or None),
+            filling the cache
+        """
+        if self.store is None:
+            return None
+        _generation = self._generation(domain)
+        _rows = self.store.get(domain)
+        if _rows is None:
+            return None
+        _records = RecordSet.from_rows(domain, _rows)
+        if self.cache is not None:
+            self.cache.set(domain, _records, generation=_generation)
+        return _records
+
+    def _generation(self, domain):
+        """
+            Return the zone cache generation of a domain (None without
+            cache), taken before reading a zone
+        """
+        if self.cache is None:
+            return None
+        return self.cache.generation(domain)
+
+    def _fetch_zone(self, domain):
+        """
+            Download and index domain records, filling cache and store.
+            A listing overtaken by a write through this client is
+            returned but not cached
+        """
+        _generation = self._generation(domain)
+        _since = self.store.clock() if self.store is not None else None
+        _result = self._do_request(self.base_url + "/dns/list/%s" % domain,
+            action='list_dns_records')
         _data = self._postprocess(_result, 'list_dns_records')
-        _records = []
-        if _data:
-            for row in _data[u'records']:
-                row['domain'] = domain
-                _rec = DNSRecord.create_from_raw(row)
-                _records.append(_rec)
+        if not _data:
+            return None
+        _records = RecordSet.from_rows(domain, _data[u'records'])
+        if self.cache is not None and not self.cache.set(domain, _records,
+                generation=_generation):
+            logger.debug(u"Zone %s written while listed, not cached", domain)
+        if self.store is not None:
+            self.store.put(domain, _data[u'records'], _since)
         return _records
 
+    def _zone_changed(self, domain):
+        """
+            Drop the store snapshot of a zone written through this client
+        """
+        if self.store is not None:
+            self.store.invalidate(domain)
+
+    def iter_dns_records(self, domain, chunk_size=stream.CHUNK_SIZE):
+        """
+            Iterate over dns records of a domain while the response is
+            downloaded, so the whole zone is never held in memory. The
+            result envelope is checked as soon as it arrives: when it
+            comes before the records nothing is yielded on error; when
+            it comes after them (as the JSON object order allows) the
+            records are already yielded and the error is only logged and
+            reported to observers
+            * Args:
+             - domain (string): valid domain from name.com
+             - chunk_size (int): bytes read from the body at once
+            * Output:
+             - records (generator): DNSRecord per zone record
+        """
+        if self.cache is not None:
+            _cached = self.cache.get(domain)
+            if _cached is not None:
+                for _record in list(_cached):
+                    yield _record
+                return
+        if self.store is not None:
+            _rows = self.store.get(domain)
+            if _rows is not None:
+                for _record in DNSRecord.from_rows(domain, _rows):
+                    yield _record
+                return
+        _response = self._do_request(self.base_url + "/dns/list/%s" % domain,
+            stream=True, action='iter_dns_records')
+        if _response is None:
+            return
+        _envelope = {}
+        _checked = [False]
+        _notify = self._notify_result if self.observers else None
+
+        def _rows():
+            for _row in stream.iter_array(
+                    _response.iter_content(chunk_size), 'records', _envelope):
+                if not _checked[0] and 'result' in _envelope:
+                    _checked[0] = True
+                    if not check_result(_envelope['result'], 'iter_dns_records',
+                            _notify):
+                        return
+                yield _row
+
+        try:
+            for _record in DNSRecord.from_rows(domain, _rows()):
+                yield _record
+        finally:
+            _response.close()
+        if not _checked[0] and 'result' in _envelope:
+            check_result(_envelope['result'], 'iter_dns_records', _notify)
+
+    @observed
     def delete_dns_record(self, domain, record_id):
         """
             Delete a domain dns record given a record_id
@@ -255,20 +817,38 @@ class APIName(object):
         """
         _iter = 0
         _data = False
+        _deadline = self.retry.start()
         while not _data:
             _result = self._do_request(self.base_url + "/dns/delete/%s" % domain,
-                POST, {'record_id': record_id})
+                POST, {'record_id': record_id}, _deadline,
+                action='delete_dns_record')
             _data = self._postprocess(_result, 'delete_dns_record')
             if _data:
+                if self.cache is not None:
+                    self.cache.remove_record(domain, record_id)
+                self._zone_changed(domain)
                 return True
-            logger.warn('Try to delete %s record id, retrying...', record_id)
+            _fields = {'action': 'delete_dns_record', 'domain': domain,
+                'attempt': _iter + 1}
+            logger.warning('Try to delete %s record id, retrying...', record_id,
+                extra=_fields)
             if _iter >= MAX_DELETE_RETRIES:
-                logger.error('Max retries deleting %s record id.', record_id)
+                logger.error('Max retries deleting %s record id.', record_id,
+                    extra=_fields)
                 break
-            time.sleep(1)
             _iter += 1
+            _delay = self.retry.delay(_iter)
+            if not self.retry.fits(_delay, _deadline):
+                logger.error('Deadline exceeded deleting %s record id.',
+                    record_id, extra=_fields)
+                break
+            if self.observers:
+                self._emit('on_retry', 'delete_dns_record', '/dns/delete',
+                    _delay)
+            self.retry.wait(_delay, _deadline)
         return False
 
+    @observed
     def create_dns_record(self, domain, record):
         """
             Create a new dns record given a DNSRecord instance.
@@ -280,13 +860,18 @@ class APIName(object):
              - False (bool): record was not created (error thown)
         """
         _result = self._do_request(self.base_url + "/dns/create/%s" % domain,
-            POST, record.post_data())
+            POST, record.post_data(), action='create_dns_record',
+            idempotent=False)
         _data = self._postprocess(_result, 'create_dns_record')
         if _data:
-            _data['domain'] = domain
-            return DNSRecord.create_from_raw(_data)
+            _record = DNSRecord.create_from_raw(_data, domain)
+            if self.cache is not None:
+                self.cache.add_record(domain, _record)
+            self._zone_changed(domain)
+            return _record
         return False
 
+    @observed
     def update_dns_record(self, domain, content, record):
         """
             Update a dns record for a domain given. First current record
@@ -299,17 +884,19 @@ class APIName(object):
              - True (bool): record was properly updated
              - False (bool): record was not updated (error thrown)
         """
-        _found = self.find_dns_record(domain, content)
+        _zone = self.list_dns_records(domain)
+        _found = _zone.find(content=content)
         if _found:
             if len(_found) == 1:
                 self.delete_dns_record(domain, _found[0].record_id)
             else:
-                for _rec in _found:
-                    if _rec.hostname == record.hostname:
-                        self.delete_dns_record(domain, _rec.record_id)
+                for _rec in _zone.find(hostname=record.hostname,
+                        content=content):
+                    self.delete_dns_record(domain, _rec.record_id)
             time.sleep(0.4)
         return self.create_dns_record(domain, record)
 
+    @observed
     def update_nameservers(self, domain, nameservers):
         """
             Update nameservers, setting param list as default
@@ -322,12 +909,17 @@ class APIName(object):
              - False (bool): there was an error in process
         """
         _url = self.base_url + '/domain/update_nameservers/' + domain
-        _result = self._do_request(_url, POST, {'nameservers': nameservers})
+        _result = self._do_request(_url, POST, {'nameservers': nameservers},
+            action='update_nameservers')
         _data = self._postprocess(_result, 'update_nameservers')
         if _data:
+            if self.domain_cache is not None:
+                self.domain_cache.update_info(domain,
+                    nameservers=list(nameservers))
             return True
         return False
 
+    @observed
     def get_domain(self, domain, check=True):
         """
             Retrieve domain info (creation and expire dates, locked,
@@ -338,12 +930,149 @@ class APIName(object):
             * Output:
              - False (bool): domain was not found
              - True (bool): domain was found (check = True)
-             - Response (request.Response): domain was found (check = False)
+             - data (dict): domain info (check = False). When domain_cache
+               is enabled the dict is shared with it; do not modify it
         """
-        _response = self._do_request(self.base_url + "/domain/get/%s" % domain)
-        _data = self._postprocess(_response, 'get_domain')
+        _data = None
+        if self.domain_cache is not None:
+            _data = self.domain_cache.get(domain)
+        if _data is None:
+            _data = self._lookup_domain(domain)
         if not _data:
             return False
         if check:
             return True
         return _data
+
+    def _lookup_domain(self, domain):
+        """
+            Fetch domain info, sharing concurrent identical lookups
+        """
+        if self.flights is not None:
+            return self.flights.do(('/domain/get', domain), self._fetch_domain,
+                domain)
+        return self._fetch_domain(domain)
+
+    def _fetch_domain(self, domain):
+        """
+            Request domain info, filling the domain cache. Only domains
+            name.com reports as missing are cached as such, not errors
+            * Output:
+             - data (dict): domain info
+             - False (bool): domain was not found or error
+        """
+        _response = self._do_request(self.base_url + "/domain/get/%s" % domain,
+            action='get_domain')
+        if self.domain_cache is None:
+            return self._postprocess(_response, 'get_domain')
+        _codes = []
+
+        def _notify(method_name, code):
+            _codes.append(code)
+            if self.observers:
+                self._notify_result(method_name, code)
+
+        _data = False
+        if _response:
+            _data = parse_result(_response.content, 'get_domain', _notify,
+                self.codec)
+        if _data:
+            self.domain_cache.set(domain, _data)
+        elif _codes == [CODE_NOT_FOUND]:
+            self.domain_cache.set_missing(domain)
+        return _data
+
+    @observed
+    def get_domains(self, domains, check=True, max_workers=DOMAIN_WORKERS):
+        """
+            Look up many domains concurrently (see get_domain). Cached
+            answers, negative ones included, are not requested again
+            * Args:
+             - domains (iterable): domains to look up
+             - check (bool): only tell if they exist (True)
+             - max_workers (int): requests in flight (8)
+            * Output:
+             - results (OrderedDict): domain -> get_domain result, in the
+               order given
+        """
+        _results = OrderedDict.fromkeys(domains)
+        _missing = []
+        for _domain in _results:
+            if self.domain_cache is not None:
+                _results[_domain] = self.domain_cache.get(_domain)
+            if _results[_domain] is None:
+                _missing.append(_domain)
+        if _missing:
+            with ThreadPoolExecutor(max_workers=max_workers) as _pool:
+                for _domain, _data in zip(_missing, _pool.map(
+                        self._lookup_domain, _missing)):
+                    _results[_domain] = _data
+        for _domain, _data in _results.items():
+            _results[_domain] = _data if not _data or not check else True
+        return _results
+
+    def apply_batch(self, operations, max_workers=batch.MAX_WORKERS,
+            per_domain=batch.PER_DOMAIN):
+        """
+            Run many dns record operations concurrently (see
+            api_name.batch.apply_batch). Size the connection pool
+            (pool_size) to max_workers to avoid waiting for connections
+            * Args:
+             - operations (iterable): BatchOperation instances
+             - max_workers (int): global parallelism (8)
+             - per_domain (int): parallelism per domain (2)
+            * Output:
+             - results (list): BatchResult per operation, in input order
+        """
+        return batch.apply_batch(self, operations, max_workers, per_domain)
+
+    @observed
+    def sync_zone(self, domain, desired_records, dry_run=False,
+            max_workers=batch.MAX_WORKERS, per_domain=batch.PER_DOMAIN):
+        """
+            Reconcile a zone with the desired records issuing only the
+            needed creates and deletes (see api_name.sync.sync_zone)
+            * Args:
+             - domain (string): valid domain from name.com
+             - desired_records (iterable): DNSRecord wanted in the zone
+             - dry_run (bool): only return the plan (False)
+            * Output:
+             - plan (ZonePlan): changeset and per operation results
+             - False (bool): zone could not be retrieved
+        """
+        return sync.sync_zone(self, domain, desired_records, dry_run,
+            max_workers, per_domain)
+
+    def watch_zones(self, domains, interval=watcher.INTERVAL,
+            jitter=watcher.JITTER, max_workers=watcher.MAX_WORKERS,
+            callback=None):
+        """
+            Start polling zones for out of band changes (see
+            api_name.watcher.ZoneWatcher)
+            * Args:
+             - domains (iterable): zones to watch
+             - interval (float): seconds between polls of a zone (60)
+             - jitter (float): random +- ratio of interval (0.1)
+             - max_workers (int): max zones polled at once (8)
+             - callback (callable): called with each ZoneEvent
+            * Output:
+             - watcher (ZoneWatcher): started watcher, stop() it when done
+        """
+        return watcher.ZoneWatcher(self, domains, interval, jitter,
+            max_workers, callback).start()
+
+    def write_behind(self, delay=writebehind.DELAY,
+            max_delay=writebehind.MAX_DELAY,
+            max_workers=writebehind.MAX_WORKERS):
+        """
+            Return a queue coalescing record updates per hostname and
+            type (see api_name.writebehind.WriteBehindQueue)
+            * Args:
+             - delay (float): debounce seconds (1)
+             - max_delay (float): max seconds an update is held (10)
+             - max_workers (int): domains flushed at once (4)
+            * Output:
+             - queue (WriteBehindQueue): close() it to drain it
+        """
+        return writebehind.WriteBehindQueue(self, delay, max_delay,
+            max_workers)
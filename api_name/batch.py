@@ -0,0 +1,131 @@
+# -*- encoding:utf8 -*-
+
+from collections import namedtuple, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Operation actions
+CREATE = 'create'
+DELETE = 'delete'
+UPDATE = 'update'
+
+# Default global and per domain parallelism
+MAX_WORKERS = 8
+PER_DOMAIN = 2
+
+
+class BatchOperation(namedtuple('BatchOperation',
+        'action domain record record_id content')):
+    """
+        Single dns record operation of a batch. Use the create, delete
+        and update constructors:
+         * create (domain, record): create_dns_record
+         * delete (domain, record_id): delete_dns_record
+         * update (domain, content, record): update_dns_record
+    """
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, domain, record):
+        return cls(CREATE, domain, record, None, None)
+
+    @classmethod
+    def delete(cls, domain, record_id):
+        return cls(DELETE, domain, None, record_id, None)
+
+    @classmethod
+    def update(cls, domain, content, record):
+        return cls(UPDATE, domain, record, None, content)
+
+
+class BatchResult(namedtuple('BatchResult',
+        'operation success result error elapsed')):
+    """
+        Outcome of a BatchOperation
+         * operation (BatchOperation) = operation executed
+         * success (bool) = operation succeeded
+         * result = value returned by the APIName method
+         * error (Exception) = exception raised, if any
+         * elapsed (float) = seconds spent executing the operation
+    """
+    __slots__ = ()
+
+
+def execute_operation(api, operation):
+    """
+        Run a single BatchOperation against an APIName instance
+        * Args:
+         - api (APIName): client
+         - operation (BatchOperation): operation to run
+        * Output:
+         - result (BatchResult)
+    """
+    _start = time.time()
+    _result, _error = None, None
+    try:
+        if operation.action == CREATE:
+            _result = api.create_dns_record(operation.domain, operation.record)
+        elif operation.action == DELETE:
+            _result = api.delete_dns_record(operation.domain,
+                operation.record_id)
+        elif operation.action == UPDATE:
+            _result = api.update_dns_record(operation.domain,
+                operation.content, operation.record)
+        else:
+            raise ValueError(u"Unknown batch action %s" % operation.action)
+    except Exception as _exc:
+        logger.error(u"Error running %s on %s: %s", operation.action,
+            operation.domain, _exc)
+        _error = _exc
+    return BatchResult(operation, _error is None and bool(_result), _result,
+        _error, time.time() - _start)
+
+
+def apply_batch(api, operations, max_workers=MAX_WORKERS, per_domain=PER_DOMAIN):
+    """
+        Run dns record operations concurrently on a worker pool.
+        Operations are grouped per domain: at most per_domain operations
+        of the same domain and max_workers overall are in flight at once.
+        Operations of a domain start in the order given.
+        * Args:
+         - api (APIName): client
+         - operations (iterable): BatchOperation instances
+         - max_workers (int): global parallelism (8)
+         - per_domain (int): parallelism per domain (2)
+        * Output:
+         - results (list): BatchResult per operation, in input order
+    """
+    _queues = OrderedDict()
+    _total = 0
+    for _pos, _operation in enumerate(operations):
+        _queues.setdefault(_operation.domain, deque()).append(
+            (_pos, _operation))
+        _total += 1
+    _results = [None] * _total
+    _running = dict((_domain, 0) for _domain in _queues)
+    _pending = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as _pool:
+        while _queues or _pending:
+            # Fill free slots, round robin over domains
+            for _domain in list(_queues):
+                if len(_pending) >= max_workers:
+                    break
+                _queue = _queues[_domain]
+                while _queue and _running[_domain] < per_domain and \
+                        len(_pending) < max_workers:
+                    _pos, _operation = _queue.popleft()
+                    _future = _pool.submit(execute_operation, api, _operation)
+                    _pending[_future] = (_pos, _domain)
+                    _running[_domain] += 1
+                if not _queue:
+                    del _queues[_domain]
+            _done, _ = wait(list(_pending), return_when=FIRST_COMPLETED)
+            for _future in _done:
+                _pos, _domain = _pending.pop(_future)
+                _running[_domain] -= 1
+                _results[_pos] = _future.result()
+    return _results
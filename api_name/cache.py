@@ -0,0 +1,242 @@
+# -*- encoding:utf8 -*-
+
+from collections import OrderedDict
+import threading
+import time
+
+# Default seconds a cached entry is considered fresh
+CACHE_TTL = 60
+# Default max number of cached entries
+CACHE_SIZE = 256
+# Default max number of cached domains, and seconds a missing one is kept
+DOMAIN_CACHE_SIZE = 8192
+NEGATIVE_TTL = 300
+
+
+class LRUCache(object):
+    """
+        Thread safe, size bounded LRU cache whose entries expire after
+        a TTL. Keeps hit/miss statistics.
+        Public methods:
+         * get
+         * set
+         * invalidate
+         * clear
+         * stats
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_size=CACHE_SIZE, clock=time.time):
+        """
+            Initializes an empty cache
+             * ttl (int) = seconds an entry is valid (60)
+             * max_size (int) = max number of entries (256)
+             * clock (callable) = time source (time.time)
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, count=True):
+        """
+            Return cached value for key or None if missing/expired
+        """
+        with self._lock:
+            _entry = self._data.get(key)
+            if _entry is not None and _entry[0] <= self.clock():
+                del self._data[key]
+                _entry = None
+            if _entry is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            if count:
+                self.hits += 1
+            return _entry[1]
+
+    def set(self, key, value, ttl=None):
+        """
+            Store a value, evicting least recently used entries
+        """
+        _ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (self.clock() + _ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+            Drop a cached entry
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """
+            Drop every cached entry
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+            Return cache statistics
+            * Output:
+             - stats (dict): hits, misses, evictions, size and hit ratio
+        """
+        with self._lock:
+            _total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self._data),
+                'hit_ratio': float(self.hits) / _total if _total else 0.0}
+
+
+class ZoneCache(LRUCache):
+    """
+        Cache of parsed dns records (RecordSet) keyed by domain. Writes
+        done through APIName update the cached zone instead of dropping it.
+        Cached RecordSets are never modified (copy on write), so readers
+        can iterate them while other threads write. Every write changes
+        the generation of its domain, so a listing fetched before a
+        write is not cached over it.
+        Public methods:
+         * generation
+         * add_record
+         * remove_record
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_size=CACHE_SIZE, clock=time.time):
+        super(ZoneCache, self).__init__(ttl, max_size, clock)
+        self._writes = 0
+        self._floor = 0
+        self._generations = {}
+
+    def generation(self, domain):
+        """
+            Return the write generation of a domain, to give set() when
+            the zone fetched now arrives
+        """
+        with self._lock:
+            return self._generations.get(domain, self._floor)
+
+    def _written(self, domain):
+        """
+            Start a new generation of domain (cache lock held). Forgotten
+            domains share a floor newer than any generation handed out
+        """
+        self._writes += 1
+        if len(self._generations) >= self.max_size:
+            self._generations.clear()
+            self._floor = self._writes
+        self._generations[domain] = self._writes
+
+    def set(self, key, value, ttl=None, generation=None):
+        """
+            Store a zone. When generation is given (see generation()) and
+            the zone was written since, the value is outdated: dropped
+            * Output:
+             - True (bool): stored
+             - False (bool): outdated, not stored
+        """
+        with self._lock:
+            if generation is not None and generation != \
+                    self._generations.get(key, self._floor):
+                return False
+            super(ZoneCache, self).set(key, value, ttl)
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._written(key)
+            super(ZoneCache, self).invalidate(key)
+
+    def clear(self):
+        with self._lock:
+            self._writes += 1
+            self._floor = self._writes
+            self._generations.clear()
+            super(ZoneCache, self).clear()
+
+    def _update(self, domain, change):
+        """
+            Replace a cached zone (if cached) with a changed copy, keeping
+            its expiry. The copy is made without holding the cache lock
+            and swapped in only if the entry did not change meanwhile
+        """
+        with self._lock:
+            self._written(domain)
+        while True:
+            with self._lock:
+                if self.get(domain, count=False) is None:
+                    return
+                _entry = self._data[domain]
+            _records = _entry[1].copy()
+            change(_records)
+            with self._lock:
+                if self._data.get(domain) is _entry:
+                    self._data[domain] = (_entry[0], _records)
+                    return
+
+    def add_record(self, domain, record):
+        """
+            Append a created record to a cached zone (if cached)
+        """
+        self._update(domain, lambda _records: _records.add(record))
+
+    def remove_record(self, domain, record_id):
+        """
+            Remove a deleted record from a cached zone (if cached)
+        """
+        self._update(domain, lambda _records: _records.remove(record_id))
+
+
+class DomainCache(LRUCache):
+    """
+        Cache of domain info (get_domain data) keyed by domain. Domains
+        that do not exist are cached too, as False (negative entries),
+        so they are not asked again until negative_ttl expires.
+        Public methods:
+         * set_missing
+         * update_info
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_size=DOMAIN_CACHE_SIZE,
+            negative_ttl=NEGATIVE_TTL, clock=time.time):
+        """
+             * ttl (int) = seconds domain info is valid (60)
+             * max_size (int) = max number of domains (8192)
+             * negative_ttl (int) = seconds a missing domain is
+               remembered (300)
+        """
+        super(DomainCache, self).__init__(ttl, max_size, clock)
+        self.negative_ttl = negative_ttl
+
+    def set_missing(self, domain):
+        """
+            Remember a domain does not exist
+        """
+        self.set(domain, False, self.negative_ttl)
+
+    def update_info(self, domain, **fields):
+        """
+            Change fields of cached domain info (if cached)
+        """
+        with self._lock:
+            _info = self.get(domain, count=False)
+            if _info:
+                _info = dict(_info)
+                _info.update(fields)
+                self.set(domain, _info)
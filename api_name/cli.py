@@ -0,0 +1,265 @@
+# -*- encoding:utf8 -*-
+"""
+    apiname: run dns record operations read as JSONL or CSV against the
+    name.com API. Operations are streamed through a bounded worker pool
+    and one JSON result line is written per operation, so memory stays
+    constant whatever the input size.
+
+    Input fields (JSONL keys or CSV header):
+      action        create, delete or update
+      domain        zone domain
+      hostname, type, content, ttl, priority
+                    record to create, or new record of an update
+      record_id     record to delete
+      old_content   content of the records replaced by an update
+
+    Usage:
+      apiname [--username U] [--token T] [--format jsonl|csv]
+          [--workers 8] [--unordered] [--output FILE] [FILE]
+"""
+
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import csv
+import io
+from json import loads, dumps
+import os
+import sys
+
+from api_name.api import APIName, DNSRecord, API_URL
+from api_name.batch import BatchOperation, execute_operation, CREATE, \
+    DELETE, UPDATE, MAX_WORKERS
+
+# Input formats
+JSONL = 'jsonl'
+CSV = 'csv'
+FORMATS = (JSONL, CSV)
+
+# Operations queued per worker: bounds memory and keeps workers busy
+WINDOW_PER_WORKER = 4
+
+# Environment variables with default credentials
+ENV_URL = 'APINAME_URL'
+ENV_USERNAME = 'APINAME_USERNAME'
+ENV_TOKEN = 'APINAME_TOKEN'
+
+
+def operation_from_row(row):
+    """
+        Build a BatchOperation from an input row
+        * Args:
+         - row (dict): input fields, empty values are ignored
+        * Output:
+         - operation (BatchOperation)
+        * Raises:
+         - ValueError: row is not a valid operation
+    """
+    if not isinstance(row, dict):
+        raise ValueError(u"Operation must be an object")
+    _row = dict((_key, _value) for _key, _value in row.items()
+        if _value is not None and _value != '')
+    _action = _row.get('action')
+    _domain = _row.get('domain')
+    if not _domain:
+        raise ValueError(u"Missing domain")
+    if _action == DELETE:
+        if 'record_id' not in _row:
+            raise ValueError(u"Missing record_id")
+        return BatchOperation.delete(_domain, str(_row['record_id']))
+    if _action not in (CREATE, UPDATE):
+        raise ValueError(u"Unknown action %r" % (_action,))
+    if 'content' not in _row:
+        raise ValueError(u"Missing content")
+    try:
+        _ttl = int(_row.get('ttl', 300))
+        _priority = int(_row['priority']) if 'priority' in _row else None
+    except (TypeError, ValueError):
+        raise ValueError(u"ttl and priority must be integers")
+    _record = DNSRecord(_domain, _row.get('hostname'),
+        _row.get('type', 'CNAME'), _row['content'], _ttl, _priority)
+    if _action == CREATE:
+        return BatchOperation.create(_domain, _record)
+    if 'old_content' not in _row:
+        raise ValueError(u"Missing old_content")
+    return BatchOperation.update(_domain, _row['old_content'], _record)
+
+
+def read_operations(lines, fmt=JSONL):
+    """
+        Lazily parse operations from input lines. Invalid lines do not
+        stop the stream, they are yielded with their error
+        * Args:
+         - lines (iterable): input text lines
+         - fmt (string): jsonl or csv
+        * Output:
+         - operations (generator): (line number, BatchOperation, None)
+           or (line number, None, error message)
+    """
+    if fmt == CSV:
+        _reader = csv.DictReader(lines)
+        for _row in _reader:
+            try:
+                yield _reader.line_num, operation_from_row(_row), None
+            except ValueError as error:
+                yield _reader.line_num, None, str(error)
+        return
+    for _number, _line in enumerate(lines, 1):
+        _line = _line.strip()
+        if not _line or _line.startswith('#'):
+            continue
+        try:
+            yield _number, operation_from_row(loads(_line)), None
+        except ValueError as error:
+            yield _number, None, str(error)
+
+
+def result_line(number, operation, result=None, error=None):
+    """
+        Return the JSON output line of an operation
+    """
+    _output = {'line': number, 'success': False}
+    if operation is not None:
+        _output['action'] = operation.action
+        _output['domain'] = operation.domain
+    if result is not None:
+        _output['success'] = result.success
+        _output['elapsed'] = round(result.elapsed, 6)
+        if isinstance(result.result, DNSRecord):
+            _output['record_id'] = result.result.record_id
+        elif operation.record_id is not None:
+            _output['record_id'] = operation.record_id
+        if result.error is not None:
+            error = str(result.error)
+    if error is not None:
+        _output['error'] = error
+    return dumps(_output, sort_keys=True)
+
+
+def run(api, operations, output, max_workers=MAX_WORKERS, ordered=True,
+        window=None):
+    """
+        Execute operations on a worker pool and write a result line per
+        operation. At most window operations are read ahead, so input of
+        any size runs in constant memory
+        * Args:
+         - api (APIName): client
+         - operations (iterable): read_operations tuples
+         - output (file): text stream receiving result lines
+         - max_workers (int): operations run at once (8)
+         - ordered (bool): write results in input order (True), or as
+           soon as they finish
+         - window (int): operations in flight (max_workers * 4)
+        * Output:
+         - (succeeded, failed): operation counts
+    """
+    _window = window or max_workers * WINDOW_PER_WORKER
+    _pending = deque()
+    _counts = [0, 0]
+
+    def _write(number, operation, future):
+        if future is None:
+            _line, _success = result_line(number, None, error=operation), False
+        else:
+            _result = future.result()
+            _line = result_line(number, operation, _result)
+            _success = _result.success
+        _counts[0 if _success else 1] += 1
+        output.write(_line + u"\n")
+
+    def _drain(block):
+        # Ordered: flush finished results at the head of the queue only
+        if ordered:
+            while _pending and (_pending[0][2] is None or
+                    _pending[0][2].done() or block):
+                _number, _operation, _future = _pending.popleft()
+                _write(_number, _operation, _future)
+                block = False
+            return
+        _futures = [_item[2] for _item in _pending if _item[2] is not None]
+        if block and _futures and len(_futures) == len(_pending):
+            wait(_futures, return_when=FIRST_COMPLETED)
+        for _item in list(_pending):
+            if _item[2] is None or _item[2].done():
+                _pending.remove(_item)
+                _write(*_item)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as _pool:
+        for _number, _operation, _error in operations:
+            if _operation is None:
+                _pending.append((_number, _error, None))
+            else:
+                _pending.append((_number, _operation,
+                    _pool.submit(execute_operation, api, _operation)))
+            if len(_pending) >= _window:
+                _drain(True)
+            else:
+                _drain(False)
+        while _pending:
+            _drain(True)
+    return _counts[0], _counts[1]
+
+
+def main(argv=None, stdin=None, stdout=None):
+    """
+        Console entry point
+        * Output:
+         - status (int): 0 when every operation succeeded, 1 otherwise,
+           2 on usage errors
+    """
+    _parser = argparse.ArgumentParser(prog='apiname',
+        description=__doc__.strip().split('\n')[0])
+    _parser.add_argument('input', nargs='?', default='-',
+        help='operations file, - for stdin (default)')
+    _parser.add_argument('--format', choices=FORMATS,
+        help='input format (from file extension, else jsonl)')
+    _parser.add_argument('--url', default=os.environ.get(ENV_URL, API_URL),
+        help='API url ($%s)' % ENV_URL)
+    _parser.add_argument('--username', default=os.environ.get(ENV_USERNAME),
+        help='API username ($%s)' % ENV_USERNAME)
+    _parser.add_argument('--token', default=os.environ.get(ENV_TOKEN),
+        help='API token ($%s)' % ENV_TOKEN)
+    _parser.add_argument('--workers', type=int, default=MAX_WORKERS,
+        help='operations run at once (%d)' % MAX_WORKERS)
+    _parser.add_argument('--window', type=int,
+        help='operations read ahead (workers * %d)' % WINDOW_PER_WORKER)
+    _parser.add_argument('--unordered', action='store_true',
+        help='write results as they finish instead of in input order')
+    _parser.add_argument('--output', default='-',
+        help='results file, - for stdout (default)')
+    _args = _parser.parse_args(argv)
+    if not _args.username or not _args.token:
+        _parser.error(u"--username and --token (or $%s and $%s) are required"
+            % (ENV_USERNAME, ENV_TOKEN))
+    if _args.workers < 1:
+        _parser.error(u"--workers must be positive")
+
+    _format = _args.format
+    if _format is None:
+        _format = CSV if _args.input.lower().endswith('.csv') else JSONL
+    _input, _output = stdin or sys.stdin, stdout or sys.stdout
+    if _args.input != '-':
+        _input = io.open(_args.input, encoding='utf-8', newline='')
+    if _args.output != '-':
+        _output = io.open(_args.output, 'w', encoding='utf-8')
+
+    _api = APIName(url=_args.url, username=_args.username, token=_args.token,
+        pool_size=_args.workers)
+    try:
+        _succeeded, _failed = run(_api, read_operations(_input, _format),
+            _output, _args.workers, not _args.unordered, _args.window)
+    finally:
+        _api.close()
+        if _args.input != '-':
+            _input.close()
+        if _args.output != '-':
+            _output.close()
+        else:
+            _output.flush()
+    sys.stderr.write(u"%d operations succeeded, %d failed\n" % (_succeeded,
+        _failed))
+    return 1 if _failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
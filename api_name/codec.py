@@ -0,0 +1,95 @@
+# -*- encoding:utf8 -*-
+
+import json
+
+try:
+    import orjson
+except ImportError: # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import ujson
+except ImportError: # pragma: no cover - optional speedup
+    ujson = None
+
+
+class JSONCodec(object):
+    """
+        Standard library json codec, always available. Subclasses plug
+        faster backends in.
+        Public methods:
+         * loads
+         * dumps
+    """
+    name = 'json'
+
+    def loads(self, content):
+        """
+            Decode a json document from bytes (utf-8) or text
+        """
+        return json.loads(content)
+
+    def dumps(self, obj):
+        """
+            Encode obj as compact utf-8 json bytes
+        """
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonCodec(JSONCodec):
+    """
+        orjson codec: decodes bytes without an intermediate str
+    """
+    name = 'orjson'
+
+    def loads(self, content):
+        return orjson.loads(content)
+
+    def dumps(self, obj):
+        return orjson.dumps(obj)
+
+
+class UjsonCodec(JSONCodec):
+    """
+        ujson codec
+    """
+    name = 'ujson'
+
+    def loads(self, content):
+        return ujson.loads(content)
+
+    def dumps(self, obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+# Backends by preference, with the module they need
+CODECS = (('orjson', OrjsonCodec, orjson), ('ujson', UjsonCodec, ujson),
+    ('json', JSONCodec, json))
+
+
+def available():
+    """
+        Return names of the installed codecs, fastest first
+    """
+    return [_name for _name, _class, _module in CODECS if _module is not None]
+
+
+def get_codec(name=None):
+    """
+        Return a codec instance
+        * Args:
+         - name (string): orjson, ujson or json (fastest installed)
+        * Output:
+         - codec (JSONCodec)
+        * Raises:
+         - ValueError: unknown or not installed codec
+    """
+    for _name, _class, _module in CODECS:
+        if _module is None or (name is not None and name != _name):
+            continue
+        return _class()
+    raise ValueError(u"JSON codec %s is not available" % name)
+
+
+# Codec used when none is given
+default_codec = get_codec()
@@ -0,0 +1,69 @@
+# -*- encoding:utf8 -*-
+
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
+
+# Structured fields attached to api_name log records
+FIELDS = ('action', 'method', 'domain', 'url', 'attempt', 'status_code',
+    'code')
+
+
+def request_fields(method, url, attempt=None, status_code=None):
+    """
+        Return structured log fields of a request (logging extra)
+    """
+    return {'method': method.upper(), 'url': url,
+        'domain': url.rstrip('/').rsplit('/', 1)[-1], 'attempt': attempt,
+        'status_code': status_code}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+        Formatter appending the structured fields of a record as
+        key=value pairs to the formatted message
+    """
+
+    def format(self, record):
+        _message = super(StructuredFormatter, self).format(record)
+        _pairs = [u"%s=%s" % (_field, getattr(record, _field))
+            for _field in FIELDS if getattr(record, _field, None) is not None]
+        if _pairs:
+            _message = u"%s %s" % (_message, u" ".join(_pairs))
+        return _message
+
+
+def configure_logging(handler=None, level=logging.INFO, logger_name='api_name',
+        fmt='%(asctime)s %(levelname)s %(name)s %(message)s', propagate=False):
+    """
+        Send api_name logs to handler through a queue, so callers never
+        wait on handler io (files, sockets...): a background thread
+        does the writing. Nothing is configured on import. Calling it
+        again replaces the queue of the previous call (stop its
+        listener to flush it).
+        * Args:
+         - handler (logging.Handler): destination (stderr StreamHandler)
+         - level (int): log level (INFO)
+         - logger_name (string): logger to configure (api_name)
+         - fmt (string): format of StructuredFormatter
+         - propagate (bool): also pass records to the root logger
+           handlers, synchronously (False)
+        * Output:
+         - listener (QueueListener): started listener, call stop() on exit
+           to flush pending records
+    """
+    if handler is None:
+        handler = logging.StreamHandler()
+    if handler.formatter is None:
+        handler.setFormatter(StructuredFormatter(fmt))
+    _queue = Queue(-1)
+    _logger = logging.getLogger(logger_name)
+    _logger.setLevel(level)
+    _logger.propagate = propagate
+    for _handler in list(_logger.handlers):
+        if isinstance(_handler, QueueHandler):
+            _logger.removeHandler(_handler)
+    _logger.addHandler(QueueHandler(_queue))
+    _listener = QueueListener(_queue, handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
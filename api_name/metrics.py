@@ -0,0 +1,216 @@
+# -*- encoding:utf8 -*-
+
+from collections import namedtuple
+from functools import wraps
+import bisect
+import threading
+import time
+
+# Latency histogram buckets (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class RequestEvent(namedtuple('RequestEvent',
+        'action endpoint method status_code elapsed attempts slept size')):
+    """
+        Outcome of an APIName http request
+         * action (string) = public method issuing the request
+         * endpoint (string) = API endpoint (/dns/list, /domain/get, ...)
+         * method (string) = http method
+         * status_code (int) = http status, None if no response
+         * elapsed (float) = seconds spent, retries included
+         * attempts (int) = attempts done
+         * slept (float) = seconds spent waiting between attempts
+         * size (int) = response body bytes, None if unknown
+    """
+    __slots__ = ()
+
+
+class Observer(object):
+    """
+        Base class of APIName hooks. Subclass it and override the
+        hooks needed; they are called synchronously, so keep them cheap.
+        Public methods:
+         * on_request
+         * on_call
+         * on_retry
+         * on_result
+    """
+
+    def on_request(self, event):
+        "Called after every http request (RequestEvent)"
+
+    def on_call(self, action, elapsed, success):
+        "Called after every public method call"
+
+    def on_retry(self, action, endpoint, delay):
+        """
+            Called before a method level retry (delete_dns_record) waits
+            delay seconds. Request retries come in RequestEvent
+        """
+
+    def on_result(self, action, code):
+        "Called with the name.com result code of every response"
+
+
+def observed(func):
+    """
+        Decorator timing a public APIName method for its observers.
+        Without observers it just calls the method
+    """
+    _action = func.__name__
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not self.observers:
+            return func(self, *args, **kwargs)
+        _start = time.time()
+        _result = False
+        try:
+            _result = func(self, *args, **kwargs)
+            return _result
+        finally:
+            self._emit('on_call', _action, time.time() - _start,
+                bool(_result))
+    return wrapper
+
+
+class Histogram(object):
+    """
+        Cumulative histogram with fixed buckets
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+            Return [(upper bound, count <= bound)], last bound is +Inf
+        """
+        _result, _acc = [], 0
+        for _bound, _count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            _acc += _count
+            _result.append((_bound, _acc))
+        return _result
+
+
+class MetricsCollector(Observer):
+    """
+        In-process Observer keeping latency histograms per public method
+        and per endpoint, and counters of requests, retries, sleep time,
+        result codes and response bytes. Exports Prometheus text format.
+        Public methods:
+         * render
+         * reset
+    """
+
+    def __init__(self, prefix='apiname', buckets=BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+            Drop every metric collected
+        """
+        self.calls = {}
+        self.requests = {}
+        self.request_count = {}
+        self.retries = {}
+        self.sleep = {}
+        self.codes = {}
+        self.bytes = {}
+
+    def _histogram(self, table, key):
+        _histogram = table.get(key)
+        if _histogram is None:
+            _histogram = table[key] = Histogram(self.buckets)
+        return _histogram
+
+    def on_request(self, event):
+        with self._lock:
+            self._histogram(self.requests, event.endpoint).observe(
+                event.elapsed)
+            _key = (event.endpoint, str(event.status_code))
+            self.request_count[_key] = self.request_count.get(_key, 0) + 1
+            if event.attempts > 1:
+                _key = (event.action, event.endpoint)
+                self.retries[_key] = self.retries.get(_key, 0) + \
+                    event.attempts - 1
+            if event.slept:
+                self.sleep[event.endpoint] = self.sleep.get(event.endpoint,
+                    0.0) + event.slept
+            if event.size:
+                self.bytes[event.endpoint] = self.bytes.get(event.endpoint,
+                    0) + event.size
+
+    def on_call(self, action, elapsed, success):
+        with self._lock:
+            self._histogram(self.calls, action).observe(elapsed)
+
+    def on_retry(self, action, endpoint, delay):
+        with self._lock:
+            _key = (action, endpoint)
+            self.retries[_key] = self.retries.get(_key, 0) + 1
+            self.sleep[endpoint] = self.sleep.get(endpoint, 0.0) + delay
+
+    def on_result(self, action, code):
+        with self._lock:
+            _key = (action, str(code))
+            self.codes[_key] = self.codes.get(_key, 0) + 1
+
+    def render(self):
+        """
+            Return every metric in Prometheus text exposition format
+        """
+        _lines = []
+        with self._lock:
+            self._render_histograms(_lines, 'call_duration_seconds',
+                'Latency of APIName public methods', 'action', self.calls)
+            self._render_histograms(_lines, 'request_duration_seconds',
+                'Latency of API requests, retries included', 'endpoint',
+                self.requests)
+            self._render_counter(_lines, 'requests_total', 'API requests',
+                ('endpoint', 'status'), self.request_count)
+            self._render_counter(_lines, 'retries_total', 'Request retries',
+                ('action', 'endpoint'), self.retries)
+            self._render_counter(_lines, 'retry_sleep_seconds_total',
+                'Seconds waited before retries', ('endpoint',), self.sleep)
+            self._render_counter(_lines, 'result_codes_total',
+                'name.com result codes', ('action', 'code'), self.codes)
+            self._render_counter(_lines, 'response_bytes_total',
+                'Response body bytes', ('endpoint',), self.bytes)
+        return u"\n".join(_lines) + u"\n"
+
+    def _render_histograms(self, lines, name, doc, label, table):
+        _name = u"%s_%s" % (self.prefix, name)
+        lines.append(u"# HELP %s %s" % (_name, doc))
+        lines.append(u"# TYPE %s histogram" % _name)
+        for _value, _histogram in sorted(table.items()):
+            for _bound, _count in _histogram.cumulative():
+                lines.append(u'%s_bucket{%s="%s",le="%s"} %d' % (_name, label,
+                    _value, _bound, _count))
+            lines.append(u'%s_sum{%s="%s"} %s' % (_name, label, _value,
+                repr(_histogram.total)))
+            lines.append(u'%s_count{%s="%s"} %d' % (_name, label, _value,
+                _histogram.count))
+
+    def _render_counter(self, lines, name, doc, labels, table):
+        _name = u"%s_%s" % (self.prefix, name)
+        lines.append(u"# HELP %s %s" % (_name, doc))
+        lines.append(u"# TYPE %s counter" % _name)
+        for _key, _value in sorted(table.items()):
+            if not isinstance(_key, tuple):
+                _key = (_key,)
+            _labels = u",".join(u'%s="%s"' % _pair
+                for _pair in zip(labels, _key))
+            lines.append(u"%s{%s} %s" % (_name, _labels, _value))
@@ -0,0 +1,273 @@
+# -*- encoding:utf8 -*-
+
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+
+from api_name import batch
+from api_name.api import APIName, RecordSet, API_URL
+from api_name.cache import DomainCache
+from api_name.ratelimit import TokenBucket
+from api_name.transport import POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class Account(namedtuple('Account',
+        'name username token url domains concurrency rate burst')):
+    """
+        Credentials and limits of a name.com account
+         * name (string) = account alias
+         * username, token (string) = API credentials
+         * url (string) = API url (API_URL, DEV_API_URL for tests)
+         * domains (iterable) = domains owned, others are discovered
+         * concurrency (int) = max requests in flight (10)
+         * rate, burst (float) = requests per second limit (None)
+    """
+    __slots__ = ()
+
+    def __new__(cls, name, username, token, url=API_URL, domains=(),
+            concurrency=POOL_SIZE, rate=None, burst=None):
+        return super(Account, cls).__new__(cls, name, username, token, url,
+            tuple(domains), concurrency, rate, burst)
+
+
+class _Member(object):
+    """
+        Client of an account and its concurrency bound
+    """
+    __slots__ = ('account', 'api', 'slots')
+
+    def __init__(self, account, api):
+        self.account = account
+        self.api = api
+        self.slots = threading.BoundedSemaphore(account.concurrency)
+
+
+class APINamePool(object):
+    """
+        Several name.com accounts behind one client. Each domain is
+        routed to the account owning it, declared or discovered with
+        get_domain, and every account keeps its own connection pool,
+        concurrency bound and rate limit. Portfolio wide reads fan out
+        in parallel, so throughput grows with the accounts.
+        Public methods:
+         * route
+         * client
+         * add_domain
+         * fan_out
+         * list_all
+         * list_dns_records
+         * iter_dns_records
+         * get_dns_record
+         * find_dns_record
+         * create_dns_record
+         * delete_dns_record
+         * update_dns_record
+         * update_nameservers
+         * get_domain
+         * sync_zone
+         * apply_batch
+         * close
+    """
+
+    def __init__(self, accounts, max_workers=None, discover=True, **options):
+        """
+             * accounts (iterable) = Account instances
+             * max_workers (int) = fan out parallelism (sum of account
+               concurrency)
+             * discover (bool) = find the owner of undeclared domains
+               asking every account (True)
+             * options = APIName arguments shared by every account
+               (cache, retry, observers, store, coalesce...). A
+               domain_cache is used as template: a domain missing in an
+               account may exist in another, so each account gets its
+               own DomainCache with the same settings
+        """
+        self.members = OrderedDict()
+        self._routes = {}
+        self._lock = threading.Lock()
+        self.discover = discover
+        _domain_cache = options.pop('domain_cache', None)
+        for _account in accounts:
+            if _account.name in self.members:
+                raise ValueError(u"Duplicated account %s" % _account.name)
+            _limiter = TokenBucket(_account.rate, _account.burst) \
+                if _account.rate else None
+            _domains = None
+            if _domain_cache is not None:
+                _domains = DomainCache(_domain_cache.ttl,
+                    _domain_cache.max_size, _domain_cache.negative_ttl,
+                    _domain_cache.clock)
+            _api = APIName(url=_account.url, username=_account.username,
+                token=_account.token, pool_size=_account.concurrency,
+                rate_limiter=_limiter, domain_cache=_domains, **options)
+            self.members[_account.name] = _Member(_account, _api)
+            for _domain in _account.domains:
+                self._routes[_domain] = _account.name
+        if not self.members:
+            raise ValueError(u"APINamePool needs at least one account")
+        self.max_workers = max_workers or sum(_member.account.concurrency
+            for _member in self.members.values())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+            Release connections of every account
+        """
+        for _member in self.members.values():
+            _member.api.close()
+
+    def add_domain(self, domain, account):
+        """
+            Route a domain to an account (by name)
+        """
+        if account not in self.members:
+            raise KeyError(account)
+        with self._lock:
+            self._routes[domain] = account
+
+    def route(self, domain):
+        """
+            Return the name of the account owning a domain
+            * Output:
+             - name (string): account name
+             - None: no account owns the domain
+        """
+        _name = self._routes.get(domain)
+        if _name is not None:
+            return _name
+        if len(self.members) == 1:
+            return next(iter(self.members))
+        if not self.discover:
+            logger.error(u"No account routed for %s", domain)
+            return None
+        for _name, _member in self.members.items():
+            with _member.slots:
+                _found = _member.api.get_domain(domain)
+            if _found:
+                with self._lock:
+                    self._routes[domain] = _name
+                return _name
+        logger.error(u"No account owns %s", domain)
+        return None
+
+    def client(self, domain):
+        """
+            Return the APIName of the account owning a domain, or None
+        """
+        _name = self.route(domain)
+        return self.members[_name].api if _name is not None else None
+
+    def _call(self, method, domain, default, *args):
+        """
+            Run an APIName method on the account owning domain, within
+            its concurrency bound
+        """
+        _name = self.route(domain)
+        if _name is None:
+            return default
+        _member = self.members[_name]
+        with _member.slots:
+            return getattr(_member.api, method)(domain, *args)
+
+    def list_dns_records(self, domain):
+        return self._call('list_dns_records', domain, RecordSet())
+
+    def get_dns_record(self, domain, record_id):
+        return self._call('get_dns_record', domain, None, record_id)
+
+    def find_dns_record(self, domain, content):
+        return self._call('find_dns_record', domain, [], content)
+
+    def create_dns_record(self, domain, record):
+        return self._call('create_dns_record', domain, False, record)
+
+    def delete_dns_record(self, domain, record_id):
+        return self._call('delete_dns_record', domain, False, record_id)
+
+    def update_dns_record(self, domain, content, record):
+        return self._call('update_dns_record', domain, False, content, record)
+
+    def update_nameservers(self, domain, nameservers):
+        return self._call('update_nameservers', domain, False, nameservers)
+
+    def get_domain(self, domain, check=True):
+        return self._call('get_domain', domain, False, check)
+
+    def sync_zone(self, domain, desired_records, dry_run=False):
+        return self._call('sync_zone', domain, False, desired_records, dry_run)
+
+    def iter_dns_records(self, domain, **kwargs):
+        """
+            Stream dns records of a domain (see APIName.iter_dns_records).
+            The account slot is held until the generator is exhausted
+        """
+        _name = self.route(domain)
+        if _name is None:
+            return
+        _member = self.members[_name]
+        with _member.slots:
+            for _record in _member.api.iter_dns_records(domain, **kwargs):
+                yield _record
+
+    def _interleave(self, domains):
+        """
+            Order domains round robin over their accounts, so fan out
+            workers are not all waiting on the slots of one account
+        """
+        _queues = OrderedDict()
+        for _domain in domains:
+            _queues.setdefault(self._routes.get(_domain), []).append(_domain)
+        _queues = [list(reversed(_queue)) for _queue in _queues.values()]
+        while _queues:
+            for _queue in _queues:
+                yield _queue.pop()
+            _queues = [_queue for _queue in _queues if _queue]
+
+    def fan_out(self, method, domains, *args):
+        """
+            Call an APIName method for many domains in parallel, each on
+            the account owning it
+            * Args:
+             - method (string): APIName method name (list_dns_records...)
+             - domains (iterable): domains, first argument of the method
+             - args: rest of the method arguments
+            * Output:
+             - results (OrderedDict): domain -> method result, in the
+               order domains were given
+        """
+        _domains = list(OrderedDict.fromkeys(domains))
+        _method = getattr(self, method)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as _pool:
+            _futures = dict((_domain, _pool.submit(_method, _domain, *args))
+                for _domain in self._interleave(_domains))
+        return OrderedDict((_domain, _futures[_domain].result())
+            for _domain in _domains)
+
+    def list_all(self, domains=None):
+        """
+            List dns records of many domains in parallel
+            * Args:
+             - domains (iterable): domains (every declared domain)
+            * Output:
+             - records (OrderedDict): domain -> RecordSet
+        """
+        if domains is None:
+            domains = sorted(self._routes)
+        return self.fan_out('list_dns_records', domains)
+
+    def apply_batch(self, operations, max_workers=None,
+            per_domain=batch.PER_DOMAIN):
+        """
+            Run dns record operations of any account concurrently (see
+            api_name.batch.apply_batch)
+        """
+        return batch.apply_batch(self, operations,
+            max_workers or self.max_workers, per_domain)
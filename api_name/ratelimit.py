@@ -0,0 +1,125 @@
+# -*- encoding:utf8 -*-
+
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # pragma: no cover - not available on windows
+    fcntl = None
+
+
+class TokenBucket(object):
+    """
+        Token bucket rate limiter, safe to share between threads. Allows
+        bursts up to burst requests and rate requests per second on
+        average.
+        Public methods:
+         * reserve
+         * acquire
+    """
+
+    def __init__(self, rate, burst=None, clock=time.time, sleep=time.sleep):
+        """
+             * rate (float) = tokens added per second
+             * burst (int) = bucket capacity (rate, at least 1)
+             * clock (callable) = time source (time.time)
+             * sleep (callable) = blocking sleep (time.sleep)
+        """
+        self.rate = float(rate)
+        # A bucket holding less than one token never serves a request
+        self.burst = max(1.0, float(burst or rate))
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._stamp = clock()
+
+    def _take(self, tokens, state):
+        """
+            Refill state (tokens, stamp) and try to take tokens
+            * Output:
+             - wait (float): 0 when taken, else seconds until available
+             - state (tuple): new (tokens, stamp)
+            * Raises:
+             - ValueError: more tokens than the bucket capacity
+        """
+        if tokens > self.burst:
+            raise ValueError(u"Cannot take %s tokens from a bucket of %s" %
+                (tokens, self.burst))
+        _tokens, _stamp = state
+        _now = self.clock()
+        _tokens = min(self.burst, _tokens + max(0.0, _now - _stamp) * self.rate)
+        if _tokens >= tokens:
+            return 0.0, (_tokens - tokens, _now)
+        return (tokens - _tokens) / self.rate, (_tokens, _now)
+
+    def reserve(self, tokens=1):
+        """
+            Try to take tokens without blocking
+            * Output:
+             - 0.0 (float): tokens taken
+             - wait (float): seconds to wait before trying again
+        """
+        with self._lock:
+            _wait, (self._tokens, self._stamp) = self._take(tokens,
+                (self._tokens, self._stamp))
+        return _wait
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+            Block until tokens are taken
+            * Args:
+             - tokens (int): tokens needed (1)
+             - timeout (float): max seconds to wait, None forever
+            * Output:
+             - True (bool): tokens taken
+             - False (bool): timeout expired
+        """
+        _limit = None if timeout is None else self.clock() + timeout
+        while True:
+            _wait = self.reserve(tokens)
+            if not _wait:
+                return True
+            if _limit is not None and self.clock() + _wait > _limit:
+                return False
+            self.sleep(_wait)
+
+
+class FileTokenBucket(TokenBucket):
+    """
+        Token bucket whose state lives in a local file locked with
+        flock, so every process of a host (and their threads) share
+        the same rate limit.
+    """
+
+    _FORMAT = '!dd'
+
+    def __init__(self, path, rate, burst=None, clock=time.time,
+            sleep=time.sleep):
+        """
+             * path (string) = state file, created if missing
+        """
+        if fcntl is None:
+            raise RuntimeError(u"FileTokenBucket requires fcntl (posix)")
+        super(FileTokenBucket, self).__init__(rate, burst, clock, sleep)
+        self.path = path
+
+    def reserve(self, tokens=1):
+        with self._lock:
+            _fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(_fd, fcntl.LOCK_EX)
+                _raw = os.read(_fd, struct.calcsize(self._FORMAT))
+                if len(_raw) == struct.calcsize(self._FORMAT):
+                    _state = struct.unpack(self._FORMAT, _raw)
+                else:
+                    _state = (self.burst, self.clock())
+                _wait, _state = self._take(tokens, _state)
+                os.lseek(_fd, 0, os.SEEK_SET)
+                os.write(_fd, struct.pack(self._FORMAT, *_state))
+            finally:
+                os.close(_fd)
+        return _wait
@@ -0,0 +1,168 @@
+# -*- encoding:utf8 -*-
+
+from email.utils import parsedate_tz, mktime_tz
+import random
+import time
+
+# Default connect and read timeouts (seconds)
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+# Default attempts per request
+MAX_ATTEMPTS = 3
+# Default backoff: first delay and max delay (seconds)
+BACKOFF = 0.5
+MAX_BACKOFF = 8
+# Default budget of a whole call, retries included (seconds)
+DEADLINE = 60
+# Http status codes worth a retry (idempotent requests only)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class Deadline(object):
+    """
+        Time budget of a call, shared by every nested retry loop
+    """
+
+    def __init__(self, seconds, clock=time.time):
+        """
+             * seconds (float) = budget, None for unlimited
+             * clock (callable) = time source (time.time)
+        """
+        self.clock = clock
+        self.expires = None if seconds is None else clock() + seconds
+
+    def remaining(self):
+        """
+            Seconds left (None if unlimited, never negative)
+        """
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - self.clock())
+
+    def expired(self):
+        return self.remaining() == 0.0
+
+
+class RetryPolicy(object):
+    """
+        How APIName retries requests: connect/read timeouts, exponential
+        backoff with jitter, retryable http statuses (honouring
+        Retry-After) and an overall deadline per call.
+        Public methods:
+         * start
+         * timeout
+         * should_retry
+         * delay
+         * fits
+         * wait
+    """
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT, max_attempts=MAX_ATTEMPTS,
+            backoff=BACKOFF, max_backoff=MAX_BACKOFF, jitter=True,
+            retry_statuses=RETRY_STATUSES, deadline=DEADLINE,
+            clock=time.time, sleep=time.sleep):
+        """
+             * connect_timeout (float) = tcp connect timeout (5)
+             * read_timeout (float) = timeout waiting for data (30)
+             * max_attempts (int) = attempts per request (3)
+             * backoff (float) = first retry delay (0.5)
+             * max_backoff (float) = max retry delay (8)
+             * jitter (bool) = randomize delays (True)
+             * retry_statuses (tuple) = http statuses to retry, only on
+               idempotent requests
+             * deadline (float) = budget per call, None unlimited (60)
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.deadline = deadline
+        self.clock = clock
+        self.sleep = sleep
+
+    def start(self):
+        """
+            Return a new Deadline for a call
+        """
+        return Deadline(self.deadline, self.clock)
+
+    def timeout(self, deadline):
+        """
+            Return (connect, read) timeouts capped by the deadline left
+            * Output:
+             - timeout (tuple): requests timeout argument
+             - None: deadline expired
+        """
+        _left = deadline.remaining()
+        if _left is None:
+            return (self.connect_timeout, self.read_timeout)
+        if _left == 0.0:
+            return None
+        return (min(self.connect_timeout, _left), min(self.read_timeout, _left))
+
+    def should_retry(self, status_code, idempotent=True):
+        """
+            Tell if an http status is worth a retry. Requests that are
+            not idempotent (record creation) are never retried on a
+            status: the server may have applied them already
+        """
+        return idempotent and status_code in self.retry_statuses
+
+    def delay(self, attempt, response=None):
+        """
+            Seconds to wait before retry number attempt (1 based). A
+            Retry-After header in response takes precedence
+        """
+        _retry_after = retry_after(response)
+        if _retry_after is not None:
+            return _retry_after
+        _delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        if self.jitter:
+            _delay = random.uniform(0, _delay)
+        return _delay
+
+    def fits(self, seconds, deadline):
+        """
+            Tell if waiting seconds still leaves budget for a retry
+        """
+        _left = deadline.remaining()
+        return _left is None or seconds < _left
+
+    def wait(self, seconds, deadline):
+        """
+            Sleep seconds unless it would exceed the deadline
+            * Output:
+             - True (bool): slept, caller may retry
+             - False (bool): no budget left for a retry
+        """
+        if not self.fits(seconds, deadline):
+            return False
+        if seconds > 0:
+            self.sleep(seconds)
+        return True
+
+
+def retry_after(response):
+    """
+        Parse Retry-After header (seconds or http date) of a response
+        * Output:
+         - seconds (float): delay requested by the server
+         - None: no valid header
+    """
+    _headers = getattr(response, 'headers', None)
+    if not _headers:
+        return None
+    _value = _headers.get('Retry-After')
+    if not _value:
+        return None
+    try:
+        return max(0.0, float(_value))
+    except ValueError:
+        _date = parsedate_tz(_value)
+        if _date is None:
+            return None
+        return max(0.0, mktime_tz(_date) - time.time())
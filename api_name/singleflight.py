@@ -0,0 +1,73 @@
+# -*- encoding:utf8 -*-
+
+import threading
+
+
+class _Call(object):
+    """
+        Request in flight and its outcome
+    """
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+        Coalesce concurrent calls sharing a key: the first caller runs
+        the function, the others wait and get its result (or its
+        exception). Nothing is kept once the call finishes.
+        Public methods:
+         * do
+         * stats
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, func, *args):
+        """
+            Run func(*args) unless a call with key is in flight, in which
+            case wait for it
+            * Output:
+             - result: func result
+            * Raises:
+             - Exception raised by func
+        """
+        with self._lock:
+            _call = self._calls.get(key)
+            _leader = _call is None
+            if _leader:
+                _call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.shared += 1
+        if not _leader:
+            _call.event.wait()
+            if _call.error is not None:
+                raise _call.error
+            return _call.result
+        try:
+            _call.result = func(*args)
+            return _call.result
+        except BaseException as _exc:
+            _call.error = _exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            _call.event.set()
+
+    def stats(self):
+        """
+            Return executed and shared (coalesced) call counters
+        """
+        with self._lock:
+            return {'executed': self.executed, 'shared': self.shared,
+                'in_flight': len(self._calls)}
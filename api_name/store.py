@@ -0,0 +1,232 @@
+# -*- encoding:utf8 -*-
+
+from json import dumps
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+from api_name.codec import default_codec
+
+logger = logging.getLogger(__name__)
+
+# Default seconds a stored zone is served without asking the API
+STORE_MAX_AGE = 300
+# Seconds a process waits for another one holding the database lock
+STORE_TIMEOUT = 30
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS zones (
+        domain TEXT PRIMARY KEY,
+        fetched REAL NOT NULL,
+        hash TEXT NOT NULL,
+        rows TEXT NOT NULL
+    )
+"""
+# Last time each zone was invalidated: older listings are not stored
+_INVALIDATIONS = """
+    CREATE TABLE IF NOT EXISTS invalidations (
+        domain TEXT PRIMARY KEY,
+        at REAL NOT NULL
+    )
+"""
+
+
+def zone_hash(payload):
+    """
+        Return the content hash (hex string) of serialized zone rows
+    """
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class ZoneStore(object):
+    """
+        Persistent zone snapshots in a SQLite database, keyed by domain:
+        raw record rows, fetch time and content hash. Lets short lived
+        processes (cron jobs, scripts) start warm instead of listing
+        every zone again. SQLite in WAL mode makes it safe for several
+        processes and threads to read and write at once.
+        Public methods:
+         * get
+         * put
+         * info
+         * touch
+         * invalidate
+         * clear
+         * domains
+         * close
+    """
+
+    def __init__(self, path, max_age=STORE_MAX_AGE, timeout=STORE_TIMEOUT,
+            clock=time.time):
+        """
+             * path (string) = database file, created if missing
+             * max_age (int) = seconds a snapshot is fresh (300)
+             * timeout (int) = seconds to wait on a locked database (30)
+             * clock (callable) = time source (time.time)
+        """
+        self.path = path
+        self.max_age = max_age
+        self.timeout = timeout
+        self.clock = clock
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._connect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _connect(self):
+        """
+            Return the connection of the calling thread (sqlite
+            connections cannot be shared between threads)
+        """
+        _conn = getattr(self._local, 'conn', None)
+        if _conn is None:
+            _conn = sqlite3.connect(self.path, timeout=self.timeout,
+                isolation_level=None, check_same_thread=False)
+            _conn.execute('PRAGMA busy_timeout = %d' %
+                int(self.timeout * 1000))
+            _conn.execute('PRAGMA journal_mode = WAL')
+            _conn.execute('PRAGMA synchronous = NORMAL')
+            _conn.execute(_SCHEMA)
+            _conn.execute(_INVALIDATIONS)
+            self._local.conn = _conn
+            with self._lock:
+                self._connections.append(_conn)
+        return _conn
+
+    def get(self, domain, max_age=None):
+        """
+            Return stored record rows of a domain
+            * Args:
+             - domain (string): zone domain
+             - max_age (int): override of the store freshness bound
+            * Output:
+             - rows (list): raw name.com record rows
+             - None: not stored, stale or unreadable
+        """
+        _max_age = self.max_age if max_age is None else max_age
+        try:
+            _row = self._connect().execute(
+                'SELECT fetched, rows FROM zones WHERE domain = ?',
+                (domain,)).fetchone()
+        except sqlite3.Error as error:
+            logger.warning(u"Cannot read %s from zone store: %s", domain,
+                error)
+            return None
+        if _row is None or _row[0] + _max_age <= self.clock():
+            return None
+        return default_codec.loads(_row[1])
+
+    def put(self, domain, rows, since=None):
+        """
+            Store the record rows of a domain, fetched now. When the
+            content hash did not change only the fetch time is updated
+            * Args:
+             - domain (string): zone domain
+             - rows (list): raw name.com record rows
+             - since (float): store clock time the listing was requested.
+               The rows are outdated, and not stored, when the zone was
+               invalidated or stored by a newer listing since then
+            * Output:
+             - hash (string): content hash of the rows
+             - None: database error or outdated rows
+        """
+        _payload = dumps(rows, sort_keys=True, separators=(',', ':'))
+        _hash = zone_hash(_payload)
+        _conn = self._connect()
+        try:
+            _conn.execute('BEGIN IMMEDIATE')
+            try:
+                if since is not None and _conn.execute(
+                        'SELECT 1 FROM invalidations WHERE domain = ? AND '
+                        'at >= ? UNION ALL SELECT 1 FROM zones WHERE '
+                        'domain = ? AND fetched > ?',
+                        (domain, since, domain, since)).fetchone():
+                    _conn.execute('COMMIT')
+                    logger.debug(u"Outdated %s listing not stored", domain)
+                    return None
+                _updated = _conn.execute('UPDATE zones SET fetched = ? '
+                    'WHERE domain = ? AND hash = ?',
+                    (self.clock(), domain, _hash)).rowcount
+                if not _updated:
+                    _conn.execute('INSERT OR REPLACE INTO zones '
+                        '(domain, fetched, hash, rows) VALUES (?, ?, ?, ?)',
+                        (domain, self.clock(), _hash, _payload))
+                _conn.execute('COMMIT')
+            except sqlite3.Error:
+                _conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as error:
+            logger.warning(u"Cannot write %s to zone store: %s", domain,
+                error)
+            return None
+        return _hash
+
+    def info(self, domain):
+        """
+            Return snapshot metadata of a domain
+            * Output:
+             - (fetched, hash): fetch time and content hash
+             - None: not stored
+        """
+        return self._connect().execute(
+            'SELECT fetched, hash FROM zones WHERE domain = ?',
+            (domain,)).fetchone()
+
+    def touch(self, domain):
+        """
+            Mark a stored snapshot as fetched now (zone known unchanged)
+        """
+        self._connect().execute('UPDATE zones SET fetched = ? '
+            'WHERE domain = ?', (self.clock(), domain))
+
+    def invalidate(self, domain):
+        """
+            Drop the snapshot of a domain, and refuse listings requested
+            before now (see put)
+        """
+        _conn = self._connect()
+        try:
+            _conn.execute('BEGIN IMMEDIATE')
+            try:
+                _conn.execute('DELETE FROM zones WHERE domain = ?', (domain,))
+                _conn.execute('INSERT OR REPLACE INTO invalidations '
+                    '(domain, at) VALUES (?, ?)', (domain, self.clock()))
+                _conn.execute('COMMIT')
+            except sqlite3.Error:
+                _conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as error:
+            logger.error(u"Cannot drop %s from zone store: %s", domain, error)
+
+    def clear(self):
+        """
+            Drop every snapshot
+        """
+        _conn = self._connect()
+        _conn.execute('DELETE FROM zones')
+        _conn.execute('DELETE FROM invalidations')
+
+    def domains(self):
+        """
+            Return stored domains
+        """
+        return [_row[0] for _row in
+            self._connect().execute('SELECT domain FROM zones ORDER BY domain')]
+
+    def close(self):
+        """
+            Close every connection opened by this store
+        """
+        with self._lock:
+            for _conn in self._connections:
+                _conn.close()
+            self._connections = []
+        self._local = threading.local()
@@ -0,0 +1,116 @@
+# -*- encoding:utf8 -*-
+
+import codecs
+from json import JSONDecoder
+
+# Bytes read from the response body at once
+CHUNK_SIZE = 64 * 1024
+
+_decoder = JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+# Characters of a json number
+_NUMBER = frozenset('0123456789.eE+-')
+
+
+def iter_array(chunks, key, envelope=None):
+    """
+        Incrementally parse a json object, read as a sequence of byte
+        chunks, yielding the items of its top level array under key as
+        soon as they are complete. The rest of the top level fields are
+        stored in envelope as they are parsed.
+        * Args:
+         - chunks (iterable): bytes of a json object
+         - key (string): top level key of the array to stream
+         - envelope (dict): receives the other top level fields
+        * Output:
+         - items (generator): decoded array items
+    """
+    if envelope is None:
+        envelope = {}
+    _utf8 = codecs.getincrementaldecoder('utf-8')()
+    _chunks = iter(chunks)
+    _buf, _pos, _eof = u'', 0, False
+    # States: object start, key, colon, value, array item, separators
+    _state, _key = 'start', None
+
+    while True:
+        while _pos < len(_buf) and _buf[_pos] in _WHITESPACE:
+            _pos += 1
+        if _pos >= len(_buf):
+            if _eof:
+                break
+            _chunk = next(_chunks, None)
+            if _chunk is None:
+                _eof = True
+                _buf, _pos = _buf[_pos:] + _utf8.decode(b'', True), 0
+            else:
+                _buf, _pos = _buf[_pos:] + _utf8.decode(_chunk), 0
+            continue
+
+        _char = _buf[_pos]
+        if _state == 'start':
+            if _char != '{':
+                raise ValueError(u"Expected json object at %d" % _pos)
+            _state, _pos = 'key', _pos + 1
+        elif _state in ('key', 'next_key') and _char == '}':
+            _state, _pos = 'end', _pos + 1
+        elif _state == 'next_key':
+            if _char != ',':
+                raise ValueError(u"Expected ',' or '}' at %d" % _pos)
+            _state, _pos = 'key', _pos + 1
+        elif _state == 'colon':
+            if _char != ':':
+                raise ValueError(u"Expected ':' at %d" % _pos)
+            _state, _pos = 'value', _pos + 1
+        elif _state == 'value' and _key == key and _char == '[':
+            _state, _pos = 'item', _pos + 1
+        elif _state in ('item', 'next_item') and _char == ']':
+            _state, _pos = 'next_key', _pos + 1
+        elif _state == 'next_item':
+            if _char != ',':
+                raise ValueError(u"Expected ',' or ']' at %d" % _pos)
+            _state, _pos = 'item', _pos + 1
+        elif _state == 'end':
+            raise ValueError(u"Extra data at %d" % _pos)
+        else:
+            # A complete json value: key string, field value or array item
+            _value, _end = _decode(_buf, _pos, _eof)
+            if _end is None:
+                if _eof:
+                    raise ValueError(u"Truncated json at %d" % _pos)
+                _chunk = next(_chunks, None)
+                if _chunk is None:
+                    _eof = True
+                    _chunk = b''
+                _buf = _buf[_pos:] + _utf8.decode(_chunk, _eof)
+                _pos = 0
+                continue
+            _pos = _end
+            if _state == 'key':
+                _key, _state = _value, 'colon'
+            elif _state == 'value':
+                envelope[_key] = _value
+                _state = 'next_key'
+            else:
+                _state = 'next_item'
+                yield _value
+    if _state != 'end':
+        raise ValueError(u"Truncated json object")
+
+
+def _decode(buf, pos, eof):
+    """
+        Decode a json value starting at pos
+        * Output:
+         - (value, end): decoded value and position after it
+         - (None, None): value is not complete yet
+    """
+    try:
+        _value, _end = _decoder.raw_decode(buf, pos)
+    except ValueError:
+        return None, None
+    # Numbers may continue in the next chunk: '1.' or '1e' decode as 1
+    if not eof and buf[pos] not in '{["' and \
+            all(_char in _NUMBER for _char in buf[_end:]):
+        return None, None
+    return _value, _end
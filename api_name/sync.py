@@ -0,0 +1,117 @@
+# -*- encoding:utf8 -*-
+
+from collections import namedtuple, OrderedDict
+import logging
+
+from api_name.batch import BatchOperation, apply_batch, MAX_WORKERS, PER_DOMAIN
+
+logger = logging.getLogger(__name__)
+
+
+class ZonePlan(namedtuple('ZonePlan',
+        'domain creates deletes unchanged results')):
+    """
+        Changeset needed to reconcile a zone with its desired state
+         * domain (string) = zone domain
+         * creates (list) = desired DNSRecord missing in the zone
+         * deletes (list) = zone DNSRecord not desired
+         * unchanged (list) = zone DNSRecord already matching
+         * results (list) = BatchResult per create and delete issued
+           (empty on dry run)
+    """
+    __slots__ = ()
+
+    @property
+    def changed(self):
+        return bool(self.creates or self.deletes)
+
+
+def relative_hostname(hostname, domain):
+    """
+        Return hostname relative to domain: 'www.test.com' and 'www'
+        both map to 'www', while the apex ('test.com', '@', '') maps to ''
+    """
+    _host = (hostname or u'').rstrip('.').lower()
+    _domain = domain.rstrip('.').lower()
+    if _host in (u'@', _domain):
+        return u''
+    if _host.endswith(u'.' + _domain):
+        return _host[:-len(_domain) - 1]
+    return _host
+
+
+def record_key(record, domain):
+    """
+        Comparison key of a record: (hostname, rtype, content, ttl,
+        priority) normalized, so API rows and user records compare equal
+    """
+    _ttl = int(record.ttl) if record.ttl not in (None, '') else None
+    _prio = int(record.priority) if record.priority not in (None, '') else None
+    return (relative_hostname(record.hostname, domain),
+        (record.rtype or u'').upper(), record.content, _ttl, _prio)
+
+
+def plan_zone(domain, current, desired):
+    """
+        Diff current zone records against desired ones (as multisets
+        keyed by record_key)
+        * Args:
+         - domain (string): zone domain
+         - current (iterable): DNSRecord in the zone
+         - desired (iterable): DNSRecord wanted
+        * Output:
+         - plan (ZonePlan): changeset without results
+    """
+    _current = OrderedDict()
+    for _record in current:
+        _current.setdefault(record_key(_record, domain), []).append(_record)
+    _creates, _unchanged = [], []
+    for _record in desired:
+        _matches = _current.get(record_key(_record, domain))
+        if _matches:
+            _unchanged.append(_matches.pop(0))
+        else:
+            _creates.append(_record)
+    _deletes = [_record for _records in _current.values()
+        for _record in _records]
+    return ZonePlan(domain, _creates, _deletes, _unchanged, [])
+
+
+def sync_zone(api, domain, desired_records, dry_run=False,
+        max_workers=MAX_WORKERS, per_domain=PER_DOMAIN):
+    """
+        Reconcile a zone with desired records: fetch it once, compute the
+        minimal changeset and issue only needed creates and deletes.
+        Every create runs before any delete so names keep resolving; a
+        delete is skipped when a create for its (hostname, rtype) failed.
+        * Args:
+         - api (APIName): client
+         - domain (string): valid domain from name.com
+         - desired_records (iterable): DNSRecord wanted in the zone
+         - dry_run (bool): only compute the plan (False)
+         - max_workers (int): global parallelism (8)
+         - per_domain (int): parallelism for the domain (2)
+        * Output:
+         - plan (ZonePlan): changeset and per operation results
+         - False (bool): zone could not be retrieved
+    """
+    _zone = api._get_zone(domain)
+    if _zone is None:
+        logger.error(u"Cannot sync %s: error retrieving zone", domain)
+        return False
+    _plan = plan_zone(domain, list(_zone), desired_records)
+    if dry_run or not _plan.changed:
+        return _plan
+
+    _results = apply_batch(api, [BatchOperation.create(domain, _record)
+        for _record in _plan.creates], max_workers, per_domain)
+    _failed = set(record_key(_result.operation.record, domain)[:2]
+        for _result in _results if not _result.success)
+    _deletes = [_record for _record in _plan.deletes
+        if record_key(_record, domain)[:2] not in _failed]
+    if len(_deletes) < len(_plan.deletes):
+        logger.warning(u"Skipping %d deletes in %s after failed creates",
+            len(_plan.deletes) - len(_deletes), domain)
+    _results.extend(apply_batch(api, [BatchOperation.delete(domain,
+        _record.record_id) for _record in _deletes], max_workers, per_domain))
+    return _plan._replace(results=_results)
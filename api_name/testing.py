@@ -0,0 +1,229 @@
+# -*- encoding:utf8 -*-
+
+from json import loads, dumps
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# name.com result envelopes
+RESULT_OK = {'code': 100, 'message': 'Command Successful'}
+RESULT_NOT_FOUND = {'code': 251, 'message': 'Object does not exist'}
+RESULT_ERROR = {'code': 250, 'message': 'Injected error'}
+
+
+class FakeNameServer(object):
+    """
+        Local stand-in of the name.com API for tests and benchmarks.
+        Implements /dns/list, /dns/create, /dns/delete, /domain/get and
+        /domain/update_nameservers with the same result envelope, plus
+        configurable latency, error injection and zone sizes.
+        Public methods:
+         * start
+         * stop
+         * add_zone
+         * fail_next
+         * count
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+            error_rate=0.0, error_status=None):
+        """
+             * host, port (string, int) = listen address (random port)
+             * latency (float) = seconds added to every response (0)
+             * jitter (float) = random extra latency, up to seconds (0)
+             * error_rate (float) = probability of an injected error (0)
+             * error_status (int) = http status of injected errors, None
+               for a 200 response with an error result code
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.zones = {}
+        self.nameservers = {}
+        self.requests = {}
+        self._failures = []
+        self._listings = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+            Base API url to give APIName
+        """
+        return 'http://%s:%d/api' % (self.host, self.port)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """
+            Serve on a background thread
+            * Output:
+             - server (FakeNameServer): self, url is set
+        """
+        self._server = _ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.fake = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+            Stop serving
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def add_zone(self, domain, size=0, rtype='A'):
+        """
+            Create (or replace) a zone with size generated records
+        """
+        with self._lock:
+            self.zones[domain] = {}
+            self.nameservers[domain] = ['ns1.name.com', 'ns2.name.com']
+            self._listings.pop(domain, None)
+            for _pos in range(size):
+                self._add_record(domain, 'host%d' % _pos, rtype,
+                    '10.%d.%d.%d' % (_pos // 65536 % 256, _pos // 256 % 256,
+                        _pos % 256), 300, None)
+
+    def fail_next(self, count=1, status=None):
+        """
+            Make the next count requests fail: http status given, or a
+            200 response with an error result code when status is None
+        """
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def count(self, endpoint=None):
+        """
+            Return requests served for endpoint (/dns/list, ...) or total
+        """
+        with self._lock:
+            if endpoint is None:
+                return sum(self.requests.values())
+            return self.requests.get(endpoint, 0)
+
+    def _add_record(self, domain, hostname, rtype, content, ttl, priority):
+        _id = str(self._next_id)
+        self._next_id += 1
+        _name = '%s.%s' % (hostname, domain) if hostname else domain
+        _row = {'record_id': _id, 'name': _name, 'type': rtype,
+            'content': content, 'ttl': str(ttl), 'priority': priority,
+            'create_date': '2015-01-01 00:00:00'}
+        self.zones[domain][_id] = _row
+        self._listings.pop(domain, None)
+        return _row
+
+    def _injected(self):
+        """
+            Return (fail, status) for the request being served
+        """
+        with self._lock:
+            if self._failures:
+                return True, self._failures.pop(0)
+        if self.error_rate and random.random() < self.error_rate:
+            return True, self.error_status
+        return False, None
+
+    def handle(self, method, path, body):
+        """
+            Serve a request
+            * Output:
+             - (status, body): http status and body bytes
+        """
+        _parts = path.strip('/').split('/')
+        _endpoint = '/' + '/'.join(_parts[1:3])
+        _domain = _parts[3] if len(_parts) > 3 else ''
+        with self._lock:
+            self.requests[_endpoint] = self.requests.get(_endpoint, 0) + 1
+        _delay = self.latency + (random.uniform(0, self.jitter)
+            if self.jitter else 0)
+        if _delay:
+            time.sleep(_delay)
+        _fail, _status = self._injected()
+        if _fail:
+            if _status:
+                return _status, b'Injected error'
+            return 200, _envelope(RESULT_ERROR)
+        _data = loads(body) if body else {}
+        with self._lock:
+            if _domain not in self.zones:
+                return 200, _envelope(RESULT_NOT_FOUND)
+            if _endpoint == '/dns/list':
+                _listing = self._listings.get(_domain)
+                if _listing is None:
+                    _listing = self._listings[_domain] = _envelope(RESULT_OK,
+                        records=list(self.zones[_domain].values()))
+                return 200, _listing
+            if _endpoint == '/dns/create' and method == 'POST':
+                _row = self._add_record(_domain, _data.get('hostname'),
+                    _data.get('type'), _data.get('content'),
+                    _data.get('ttl', 300), _data.get('priority'))
+                return 200, _envelope(RESULT_OK, **_row)
+            if _endpoint == '/dns/delete' and method == 'POST':
+                if self.zones[_domain].pop(str(_data.get('record_id')),
+                        None) is None:
+                    return 200, _envelope(RESULT_NOT_FOUND)
+                self._listings.pop(_domain, None)
+                return 200, _envelope(RESULT_OK)
+            if _endpoint == '/domain/get':
+                return 200, _envelope(RESULT_OK, domain_name=_domain,
+                    create_date='2015-01-01 00:00:00',
+                    expire_date='2030-01-01 00:00:00', locked=True,
+                    nameservers=self.nameservers[_domain])
+            if _endpoint == '/domain/update_nameservers' and method == 'POST':
+                self.nameservers[_domain] = list(_data.get('nameservers', []))
+                return 200, _envelope(RESULT_OK)
+        return 404, b'Not found'
+
+
+def _envelope(result, **data):
+    data['result'] = result
+    return dumps(data).encode('utf-8')
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+        Dispatch http requests to FakeNameServer.handle (keep-alive)
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go in separate writes: avoid delayed ack stalls
+    disable_nagle_algorithm = True
+
+    def _serve(self):
+        _length = int(self.headers.get('Content-Length') or 0)
+        _body = self.rfile.read(_length) if _length else b''
+        _status, _content = self.server.fake.handle(self.command, self.path,
+            _body)
+        self.send_response(_status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(_content)))
+        self.end_headers()
+        self.wfile.write(_content)
+
+    do_GET = _serve
+    do_POST = _serve
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,74 @@
+# -*- encoding:utf8 -*-
+
+# Default size of the connection pool kept per host
+POOL_SIZE = 10
+
+
+class TransportError(IOError):
+    """
+        Timeout or connection error raised by a transport. Requests
+        failing with it are retried by APIName
+    """
+
+
+class HTTPTransport(object):
+    """
+        Persistent HTTP transport used by APIName. Keeps a requests
+        session with a pool of keep-alive connections, so consecutive
+        calls to name.com reuse TCP+TLS connections instead of opening
+        a new one per request. requests is only imported when the first
+        transport is created.
+        Public methods:
+         * request
+         * close
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, keep_alive=True):
+        """
+            Creates the session and mounts a pooled adapter
+             * pool_size (int) = max connections kept per host (10)
+             * keep_alive (bool) = reuse connections between calls (True)
+        """
+        from requests import Session
+        from requests.adapters import HTTPAdapter
+        from requests.exceptions import Timeout, ConnectionError
+
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.session = Session()
+        self._errors = (Timeout, ConnectionError)
+        _adapter = HTTPAdapter(pool_connections=pool_size,
+            pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', _adapter)
+        self.session.mount('http://', _adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, method, url, **params):
+        """
+            Perform an http request through the pooled session
+            * Args:
+             - method (string): http method (get, post)
+             - url (string): full url
+             - params: extra requests arguments (headers, data, ...)
+            * Output:
+             - response (requests.Response)
+            * Raises:
+             - TransportError: timeout or connection error
+        """
+        try:
+            return self.session.request(method.upper(), url, **params)
+        except self._errors as _exc:
+            raise TransportError(_exc)
+
+    def close(self):
+        """
+            Close every pooled connection
+        """
+        self.session.close()
@@ -0,0 +1,187 @@
+# -*- encoding:utf8 -*-
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import heapq
+import logging
+from queue import Queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+# Default seconds between polls of a zone, jitter ratio and parallelism
+INTERVAL = 60
+JITTER = 0.1
+MAX_WORKERS = 8
+
+_MASK = (1 << 64) - 1
+
+
+class ZoneEvent(namedtuple('ZoneEvent', 'kind domain record_id record')):
+    """
+        Change detected in a watched zone
+         * kind (string) = added, removed or changed
+         * domain (string) = zone domain
+         * record_id (string) = record id
+         * record (DNSRecord) = current record (None when removed)
+    """
+    __slots__ = ()
+
+
+def record_fingerprint(record):
+    """
+        Return a compact fingerprint (int) of the record contents
+    """
+    return hash((record.hostname, record.rtype, record.content,
+        str(record.ttl), str(record.priority)))
+
+
+class ZoneWatcher(object):
+    """
+        Poll zones on a scheduler and emit ZoneEvents only when records
+        change. Between polls only a fingerprint per record and per zone
+        is kept, so memory grows with the number of records, not with
+        their contents. Polls are spread with jitter and bounded by
+        max_workers.
+        Public methods:
+         * poll
+         * start
+         * stop
+    """
+
+    def __init__(self, api, domains, interval=INTERVAL, jitter=JITTER,
+            max_workers=MAX_WORKERS, callback=None, clock=time.time):
+        """
+             * api (APIName) = client
+             * domains (iterable) = zones to watch
+             * interval (float) = seconds between polls of a zone (60)
+             * jitter (float) = random +- ratio of interval (0.1)
+             * max_workers (int) = max zones polled at once (8)
+             * callback (callable) = called with each ZoneEvent, from
+               worker threads; events go to self.events queue if None
+        """
+        self.api = api
+        self.domains = list(domains)
+        self.interval = interval
+        self.jitter = jitter
+        self.max_workers = max_workers
+        self.callback = callback
+        self.clock = clock
+        self.events = Queue()
+        self._zones = {}
+        self._records = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _emit(self, event):
+        if self.callback is not None:
+            self.callback(event)
+        else:
+            self.events.put(event)
+
+    def poll(self, domain):
+        """
+            Fetch a zone and emit events for changes since last poll.
+            The first poll of a zone only records its fingerprints
+            * Output:
+             - events (list): ZoneEvents emitted
+             - None: zone could not be retrieved
+        """
+        _zone = self.api._fetch_zone(domain)
+        if _zone is None:
+            logger.warning(u"Cannot poll %s zone", domain)
+            return None
+        _prints = [(_record.record_id, record_fingerprint(_record))
+            for _record in _zone]
+        _zone_print = 0
+        for _item in _prints:
+            _zone_print = (_zone_print + hash(_item)) & _MASK
+        _known = domain in self._zones
+        if _known and self._zones[domain] == _zone_print:
+            return []
+        _old = self._records.get(domain, {})
+        _new = dict(_prints)
+        self._zones[domain] = _zone_print
+        self._records[domain] = _new
+        if not _known:
+            return []
+        _events = []
+        for _record in _zone:
+            _before = _old.get(_record.record_id)
+            if _before is None:
+                _events.append(ZoneEvent(ADDED, domain, _record.record_id,
+                    _record))
+            elif _before != _new[_record.record_id]:
+                _events.append(ZoneEvent(CHANGED, domain, _record.record_id,
+                    _record))
+        for _record_id in _old:
+            if _record_id not in _new:
+                _events.append(ZoneEvent(REMOVED, domain, _record_id, None))
+        for _event in _events:
+            self._emit(_event)
+        return _events
+
+    def _next_poll(self, now):
+        return now + self.interval * (1 + random.uniform(-self.jitter,
+            self.jitter))
+
+    def start(self):
+        """
+            Start polling on a background thread
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+            Stop polling, waiting for polls in progress
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        """
+            Scheduler loop: zones are kept in a heap by next poll time
+        """
+        _now = self.clock()
+        _heap = [(_now + random.uniform(0, self.interval * self.jitter), _pos,
+            _domain) for _pos, _domain in enumerate(self.domains)]
+        heapq.heapify(_heap)
+        _running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as _pool:
+            while not self._stop.is_set():
+                _now = self.clock()
+                while _heap and _heap[0][0] <= _now and \
+                        len(_running) < self.max_workers:
+                    _due, _pos, _domain = heapq.heappop(_heap)
+                    _running[_pool.submit(self.poll, _domain)] = (_pos,
+                        _domain)
+                _timeout = max(0.0, _heap[0][0] - _now) if _heap else \
+                    self.interval
+                if len(_running) >= self.max_workers:
+                    _timeout = None
+                if _running:
+                    _done, _ = wait(list(_running), timeout=_timeout,
+                        return_when=FIRST_COMPLETED)
+                    for _future in _done:
+                        _pos, _domain = _running.pop(_future)
+                        if _future.exception() is not None:
+                            logger.error(u"Error polling %s: %s", _domain,
+                                _future.exception())
+                        heapq.heappush(_heap, (self._next_poll(self.clock()),
+                            _pos, _domain))
+                else:
+                    self._stop.wait(_timeout)
+            wait(list(_running))
@@ -0,0 +1,253 @@
+# -*- encoding:utf8 -*-
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import logging
+import threading
+import time
+
+from api_name.sync import relative_hostname, record_key
+
+logger = logging.getLogger(__name__)
+
+# Seconds an update waits for newer ones of the same hostname (debounce)
+DELAY = 1.0
+# Max seconds an update waits while newer ones keep coming
+MAX_DELAY = 10.0
+# Domains flushed at once
+MAX_WORKERS = 4
+
+
+class _Pending(object):
+    """
+        Latest desired record of a (hostname, rtype) and its callers
+    """
+    __slots__ = ('record', 'futures', 'first', 'last')
+
+    def __init__(self, record, future, now):
+        self.record = record
+        self.futures = [future]
+        self.first = now
+        self.last = now
+
+
+class WriteBehindQueue(object):
+    """
+        Write-behind queue of record updates in front of APIName.
+        Updates are keyed by (domain, hostname, rtype): while one waits,
+        newer updates of the same key replace it, so only the latest
+        content is applied. A background worker flushes each domain once
+        its updates settle (delay seconds without news, max_delay at
+        most): the zone is listed once, new records are created before
+        the old ones are deleted, and no fixed sleep is needed.
+        Public methods:
+         * update
+         * flush
+         * close
+         * stats
+    """
+
+    def __init__(self, api, delay=DELAY, max_delay=MAX_DELAY,
+            max_workers=MAX_WORKERS):
+        """
+             * api (APIName) = client
+             * delay (float) = debounce seconds (1)
+             * max_delay (float) = max seconds an update is held (10)
+             * max_workers (int) = domains flushed at once (4)
+        """
+        self.api = api
+        self.delay = delay
+        self.max_delay = max_delay
+        self.submitted = 0
+        self.coalesced = 0
+        self.applied = 0
+        self._pending = OrderedDict()
+        self._flushing = {}
+        self._forcing = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, domain, record):
+        """
+            Queue the replacement of every record of record.hostname and
+            record.rtype in domain with record
+            * Args:
+             - domain (string): valid domain from name.com
+             - record (DNSRecord): desired record
+            * Output:
+             - future (Future): result is the DNSRecord in the zone once
+               applied (shared by coalesced updates) or False on error
+        """
+        _key = (relative_hostname(record.hostname, domain),
+            (record.rtype or u'').upper())
+        _future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(u"WriteBehindQueue is closed")
+            _now = time.time()
+            _entries = self._pending.setdefault(domain, OrderedDict())
+            _entry = _entries.get(_key)
+            if _entry is None:
+                _entries[_key] = _Pending(record, _future, _now)
+            else:
+                _entry.record = record
+                _entry.futures.append(_future)
+                _entry.last = _now
+                self.coalesced += 1
+            self.submitted += 1
+            self._cond.notify()
+        return _future
+
+    def _due(self, entries):
+        """
+            Return the time a domain must be flushed
+        """
+        return min(min(_entry.first + self.max_delay,
+            _entry.last + self.delay) for _entry in entries.values())
+
+    def _run(self):
+        """
+            Worker loop: hand settled domains to the flush pool
+        """
+        with self._cond:
+            while True:
+                _now = time.time()
+                _next = None
+                for _domain, _entries in list(self._pending.items()):
+                    if _domain in self._flushing:
+                        continue
+                    _due = self._due(_entries)
+                    if _due <= _now or self._forcing or self._closed:
+                        del self._pending[_domain]
+                        self._flushing[_domain] = _entries
+                        self._pool.submit(self._flush_domain, _domain,
+                            _entries)
+                    elif _next is None or _due < _next:
+                        _next = _due
+                if self._closed and not self._pending and \
+                        not self._flushing:
+                    return
+                self._cond.wait(None if _next is None else _next - _now)
+
+    def _flush_domain(self, domain, entries):
+        try:
+            self._apply(domain, entries)
+        except Exception as error:
+            logger.error(u"Error flushing %s updates: %s", domain, error)
+            for _entry in entries.values():
+                _resolve(_entry.futures, error=error)
+        finally:
+            with self._cond:
+                del self._flushing[domain]
+                self._cond.notify_all()
+
+    def _apply(self, domain, entries):
+        """
+            Apply the pending updates of a domain with one zone listing
+        """
+        _zone = self.api._get_zone(domain)
+        if _zone is None:
+            logger.error(u"Cannot list %s, %d updates failed", domain,
+                len(entries), extra={'action': 'write_behind',
+                'domain': domain})
+            for _entry in entries.values():
+                _resolve(_entry.futures, False)
+            return
+        _current = {}
+        for _record in list(_zone):
+            _current.setdefault((relative_hostname(_record.hostname, domain),
+                (_record.rtype or u'').upper()), []).append(_record)
+        for _key, _entry in entries.items():
+            _existing = _current.get(_key, [])
+            _wanted = record_key(_entry.record, domain)
+            _result = None
+            for _record in _existing:
+                if record_key(_record, domain) == _wanted:
+                    _result = _record
+                    break
+            if _result is None:
+                _record = _entry.record
+                if _record.hostname != _key[0]:
+                    # name.com expects hostnames relative to the domain
+                    _record = _record.replace(hostname=_key[0])
+                _result = self.api.create_dns_record(domain, _record)
+                if not _result:
+                    _resolve(_entry.futures, False)
+                    continue
+            _deleted = True
+            for _record in _existing:
+                if _record is not _result:
+                    _deleted = self.api.delete_dns_record(domain,
+                        _record.record_id) and _deleted
+            with self._cond:
+                self.applied += 1
+            _resolve(_entry.futures, _result if _deleted else False)
+
+    def _futures(self):
+        _futures = []
+        for _table in (self._pending, self._flushing):
+            for _entries in _table.values():
+                for _entry in _entries.values():
+                    _futures.extend(_entry.futures)
+        return _futures
+
+    def flush(self, timeout=None):
+        """
+            Apply every queued update now and wait for them
+            * Output:
+             - done (bool): every update finished within timeout
+        """
+        with self._cond:
+            _futures = self._futures()
+            self._forcing += 1
+            self._cond.notify_all()
+        try:
+            _, _not_done = wait(_futures, timeout)
+        finally:
+            with self._cond:
+                self._forcing -= 1
+        return not _not_done
+
+    def close(self, timeout=None):
+        """
+            Refuse new updates, apply the queued ones (drain) and stop
+            the worker
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._pool.shutdown()
+
+    def stats(self):
+        """
+            Return queue statistics
+            * Output:
+             - stats (dict): submitted, coalesced and applied updates,
+               pending keys
+        """
+        with self._cond:
+            return {'submitted': self.submitted, 'coalesced': self.coalesced,
+                'applied': self.applied, 'pending': sum(len(_entries)
+                    for _entries in self._pending.values())}
+
+
+def _resolve(futures, result=None, error=None):
+    for _future in futures:
+        if _future.done():
+            continue
+        if error is not None:
+            _future.set_exception(error)
+        else:
+            _future.set_result(result)
@@ -0,0 +1,357 @@
+# -*- encoding:utf8 -*-
+
+import codecs
+import re
+
+from api_name.api import DNSRecord
+from api_name.stream import CHUNK_SIZE
+from api_name.sync import relative_hostname
+
+# TTL of records without one when the zone has no $TTL
+DEFAULT_TTL = 300
+# Record classes accepted (and dropped) in zone files
+CLASSES = frozenset(('IN', 'CH', 'HS', 'CS'))
+# Types whose content is a domain name: qualified on import, written
+# absolute (trailing dot) on export
+NAME_TYPES = frozenset(('CNAME', 'NS', 'PTR', 'DNAME', 'ALIAS', 'ANAME'))
+# Types skipped on import: name.com manages the SOA record
+SKIP_TYPES = ('SOA',)
+# Max length of a TXT character string
+TXT_CHUNK = 255
+
+_TTL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+_TTL_PART = re.compile(r'(\d+)([smhdw]?)', re.I)
+_ESCAPE = re.compile(r'\\(\d{3}|.)')
+_SPECIAL = frozenset('"();')
+
+
+def parse_ttl(value):
+    """
+        Return seconds (int) of a zone file TTL ('3600', '1h30m')
+        * Raises:
+         - ValueError: not a TTL
+    """
+    if value.isdigit():
+        return int(value)
+    _pos, _total = 0, 0
+    for _match in _TTL_PART.finditer(value):
+        if _match.start() != _pos:
+            break
+        _total += int(_match.group(1)) * _TTL_UNITS[
+            (_match.group(2) or 's').lower()]
+        _pos = _match.end()
+    if not _pos or _pos != len(value):
+        raise ValueError(u"Invalid TTL %r" % value)
+    return _total
+
+
+def _is_ttl(token):
+    return token[0].isdigit() and (token.isdigit() or
+        _TTL_PART.match(token) is not None)
+
+
+def _unescape(match):
+    _value = match.group(1)
+    return chr(int(_value)) if len(_value) == 3 else _value
+
+
+def _tokenize(line, depth):
+    """
+        Split a line with quotes, comments or parentheses
+        * Output:
+         - (tokens, depth): tokens (quoted strings unescaped) and open
+           parentheses at line end
+    """
+    _tokens, _pos, _size = [], 0, len(line)
+    while _pos < _size:
+        _char = line[_pos]
+        if _char in ' \t\r\n':
+            _pos += 1
+        elif _char == ';':
+            break
+        elif _char == '(':
+            depth, _pos = depth + 1, _pos + 1
+        elif _char == ')':
+            if not depth:
+                raise ValueError(u"Unbalanced ')'")
+            depth, _pos = depth - 1, _pos + 1
+        elif _char == '"':
+            _end = _pos + 1
+            while _end < _size and line[_end] != '"':
+                _end += 2 if line[_end] == '\\' else 1
+            if _end >= _size:
+                raise ValueError(u"Unterminated quoted string")
+            _tokens.append(_ESCAPE.sub(_unescape, line[_pos + 1:_end]))
+            _pos = _end + 1
+        else:
+            _end = _pos
+            while _end < _size and line[_end] not in ' \t\r\n' and \
+                    line[_end] not in _SPECIAL:
+                _end += 1
+            _tokens.append(line[_pos:_end])
+            _pos = _end
+    return _tokens, depth
+
+
+def _read_lines(source, chunk_size):
+    """
+        Yield the lines of a zone file read chunk_size at a time.
+        source may be a file object (text or bytes) or an iterable of
+        lines
+    """
+    _read = getattr(source, 'read', None)
+    if _read is None:
+        for _line in source:
+            yield _line
+        return
+    _utf8 = codecs.getincrementaldecoder('utf-8')()
+    _rest = u''
+    while True:
+        _chunk = _read(chunk_size)
+        if not _chunk:
+            break
+        if isinstance(_chunk, bytes):
+            _chunk = _utf8.decode(_chunk)
+        _lines = (_rest + _chunk).split(u'\n')
+        _rest = _lines.pop()
+        for _line in _lines:
+            yield _line
+    _rest += _utf8.decode(b'', True)
+    if _rest:
+        yield _rest
+
+
+def parse_zone(source, domain=None, origin=None, ttl=DEFAULT_TTL,
+        skip_types=SKIP_TYPES, chunk_size=CHUNK_SIZE):
+    """
+        Stream the records of a BIND zone file as DNSRecord instances,
+        reading it chunk_size at a time. Handles $ORIGIN, $TTL, '@',
+        relative and omitted owner names, TTL and class in any order,
+        parentheses, comments and quoted TXT strings. MX and SRV
+        priorities go to DNSRecord.priority; names in content are made
+        absolute (without trailing dot) and hostnames relative to
+        domain ('' for the apex), as create_dns_record expects.
+        * Args:
+         - source (file or iterable): zone file or its lines
+         - domain (string): zone domain (origin without trailing dot)
+         - origin (string): initial $ORIGIN (domain)
+         - ttl (int): TTL when the file has no $TTL (300)
+         - skip_types (iterable): record types not yielded (SOA)
+         - chunk_size (int): bytes or characters read at once
+        * Output:
+         - records (generator): DNSRecord per resource record
+        * Raises:
+         - ValueError: syntax error (line number in message)
+    """
+    if origin is None and domain is not None:
+        origin = domain.rstrip('.') + '.'
+    if origin is not None and not origin.endswith('.'):
+        origin += '.'
+    _skip = frozenset(_type.upper() for _type in skip_types)
+    _origin = origin
+    _suffix = '.' + _origin[:-1] if _origin else None
+    _default_ttl = ttl
+    _at_apex = origin is not None and domain is not None and \
+        origin[:-1].lower() == domain.rstrip('.').lower()
+    _host = None
+    _tokens, _depth, _blank, _start = [], 0, False, 0
+
+    for _number, _line in enumerate(_read_lines(source, chunk_size), 1):
+        # Fast path: plain lines are just split
+        if _depth == 0:
+            if '"' in _line or '(' in _line or ')' in _line:
+                try:
+                    _tokens, _depth = _tokenize(_line, 0)
+                except ValueError as error:
+                    raise ValueError(u"Line %d: %s" % (_number, error))
+            else:
+                _comment = _line.find(';')
+                _tokens = (_line if _comment < 0 else
+                    _line[:_comment]).split()
+            _blank, _start = _line[:1] in (' ', '\t'), _number
+        else:
+            try:
+                _more, _depth = _tokenize(_line, _depth)
+            except ValueError as error:
+                raise ValueError(u"Line %d: %s" % (_number, error))
+            _tokens.extend(_more)
+        if _depth or not _tokens:
+            continue
+
+        try:
+            _first = _tokens[0]
+            if _first[0] == '$':
+                _directive = _first.upper()
+                if _directive == '$ORIGIN':
+                    _origin = _absolute(_tokens[1], _origin)
+                    _suffix = '.' + _origin[:-1]
+                    if domain is None:
+                        domain = _origin[:-1]
+                    _at_apex = _origin[:-1].lower() == domain.lower()
+                elif _directive == '$TTL':
+                    _default_ttl = parse_ttl(_tokens[1])
+                else:
+                    raise ValueError(u"%s is not supported" % _first)
+                continue
+
+            if _blank:
+                if _host is None:
+                    raise ValueError(u"Missing owner name")
+                _pos = 0
+            else:
+                if domain is None:
+                    raise ValueError(u"Unknown zone domain")
+                if _first == '@':
+                    if _origin is None:
+                        raise ValueError(u"No $ORIGIN for '@'")
+                    _host = relative_hostname(_origin, domain)
+                elif _first[-1] == '.':
+                    _host = relative_hostname(_first, domain)
+                elif _origin is None:
+                    raise ValueError(u"No $ORIGIN for %s" % _first)
+                elif _at_apex:
+                    # Relative to the zone itself: already the hostname
+                    _host = _first.lower()
+                else:
+                    _host = relative_hostname(_first + _suffix, domain)
+                _pos = 1
+
+            _ttl = _default_ttl
+            for _ in (0, 1):
+                _token = _tokens[_pos]
+                if _token.upper() in CLASSES:
+                    _pos += 1
+                elif _is_ttl(_token):
+                    _ttl = parse_ttl(_token)
+                    _pos += 1
+            _rtype = _tokens[_pos].upper()
+            if _rtype in _skip:
+                continue
+            _rdata = _tokens[_pos + 1:]
+            if not _rdata:
+                raise ValueError(u"Missing %s record data" % _rtype)
+            _priority = None
+            if _rtype == 'MX':
+                _priority = int(_rdata[0])
+                _content = _qualify(_rdata[1], _origin, _suffix)
+            elif _rtype == 'SRV':
+                _priority = int(_rdata[0])
+                _content = u"%s %s %s" % (_rdata[1], _rdata[2],
+                    _qualify(_rdata[3], _origin, _suffix))
+            elif _rtype in NAME_TYPES:
+                _content = _qualify(_rdata[0], _origin, _suffix)
+            elif _rtype == 'TXT' or _rtype == 'SPF':
+                _content = u''.join(_rdata)
+            else:
+                _content = u' '.join(_rdata)
+        except IndexError:
+            raise ValueError(u"Line %d: Incomplete record" % _start)
+        except ValueError as error:
+            raise ValueError(u"Line %d: %s" % (_start, error))
+        yield DNSRecord(domain, _host, _rtype, _content, _ttl, _priority)
+
+    if _depth:
+        raise ValueError(u"Line %d: Unbalanced '('" % _start)
+
+
+def _absolute(name, origin):
+    """
+        Return name absolute, with trailing dot
+    """
+    if name == '@':
+        return origin
+    if name.endswith('.'):
+        return name
+    if origin is None:
+        raise ValueError(u"No $ORIGIN for %s" % name)
+    return name + '.' + origin
+
+
+def _qualify(name, origin, suffix):
+    """
+        Return name in record content absolute, without trailing dot
+    """
+    if name == '@':
+        if origin is None:
+            raise ValueError(u"No $ORIGIN for '@'")
+        return origin[:-1]
+    if name[-1] == '.':
+        return name[:-1]
+    if suffix is None:
+        raise ValueError(u"No $ORIGIN for %s" % name)
+    return name + suffix
+
+
+def _quote_txt(content):
+    """
+        Return TXT content as quoted character strings of 255 chars
+    """
+    _escaped = content.replace('\\', '\\\\').replace('"', '\\"')
+    if len(content) <= TXT_CHUNK:
+        return u'"%s"' % _escaped
+    return u' '.join(u'"%s"' % content[_pos:_pos + TXT_CHUNK].replace(
+        '\\', '\\\\').replace('"', '\\"')
+        for _pos in range(0, len(content), TXT_CHUNK))
+
+
+def _dotted(name):
+    return name if name.endswith('.') else name + '.'
+
+
+def format_record(record, domain):
+    """
+        Return the zone file line (without newline) of a DNSRecord.
+        Hostnames may be absolute (API rows) or relative (user records)
+    """
+    _name = relative_hostname(record.hostname, domain) or u'@'
+    _rtype = (record.rtype or u'').upper()
+    _content = record.content or u''
+    if _rtype == 'MX':
+        _rdata = u"%s %s" % (record.priority or 0, _dotted(_content))
+    elif _rtype == 'SRV':
+        _parts = _content.split()
+        if _parts:
+            _parts[-1] = _dotted(_parts[-1])
+        _rdata = u"%s %s" % (record.priority or 0, u' '.join(_parts))
+    elif _rtype in NAME_TYPES:
+        _rdata = _dotted(_content)
+    elif _rtype == 'TXT' or _rtype == 'SPF':
+        _rdata = _quote_txt(_content)
+    else:
+        _rdata = _content
+    if record.ttl in (None, ''):
+        return u"%s IN %s %s" % (_name, _rtype, _rdata)
+    return u"%s %s IN %s %s" % (_name, record.ttl, _rtype, _rdata)
+
+
+def format_zone(records, domain, ttl=None):
+    """
+        Stream the lines of a BIND zone file for records
+        * Args:
+         - records (iterable): DNSRecord instances, e.g. the output of
+           list_dns_records or iter_dns_records
+         - domain (string): zone domain, written as $ORIGIN
+         - ttl (int): $TTL written in the header (None)
+        * Output:
+         - lines (generator): zone file lines, without newline
+    """
+    _domain = domain.rstrip('.')
+    yield u"$ORIGIN %s." % _domain
+    if ttl is not None:
+        yield u"$TTL %d" % ttl
+    for _record in records:
+        yield format_record(_record, _domain)
+
+
+def write_zone(records, output, domain, ttl=None):
+    """
+        Write records to a text file as a BIND zone file, one record at
+        a time
+        * Output:
+         - count (int): records written
+    """
+    _count = -1 if ttl is None else -2
+    for _line in format_zone(records, domain, ttl):
+        output.write(_line + u"\n")
+        _count += 1
+    return _count
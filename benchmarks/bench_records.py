@@ -0,0 +1,112 @@
+# -*- encoding:utf8 -*-
+"""
+    DNSRecord decoding benchmark: time and memory needed to decode the
+    'records' rows of a list response, comparing the legacy dict backed
+    record (decoded with create_from_raw remapping) with the slotted
+    DNSRecord bulk decoder, and time to decode a whole list response
+    body with every installed json codec.
+
+    Usage: python -m benchmarks.bench_records [zone sizes...]
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+
+from api_name import codec
+from api_name.api import DNSRecord, parse_result
+
+ZONE_SIZES = (1000, 10000, 50000)
+
+
+class LegacyRecord(object):
+    """
+        Dict backed record, as DNSRecord was before being slotted
+    """
+    def __init__(self, domain=None, hostname=None, rtype='CNAME', content=None,
+            ttl=300, priority=None, record_id=None, create_date=None):
+        self.record_id = record_id
+        self.domain = domain
+        self.hostname = hostname
+        self.rtype = rtype
+        self.content = content
+        self.ttl = ttl
+        self.priority = priority
+        self.create_date = create_date
+
+
+def legacy_decode(domain, rows):
+    "Per row copy, key remapping and kwargs expansion"
+    _records = []
+    for row in rows:
+        row = dict(row)
+        row['domain'] = domain
+        row['rtype'] = row.pop('type')
+        row['hostname'] = row.pop('name')
+        _records.append(LegacyRecord(**row))
+    return _records
+
+
+def bulk_decode(domain, rows):
+    "Slotted DNSRecord bulk decoder"
+    return list(DNSRecord.from_rows(domain, rows))
+
+
+def make_rows(size):
+    "Build list response rows for a zone"
+    return [{'record_id': str(_pos), 'name': 'host%d.test.com' % _pos,
+        'type': 'A', 'content': '10.0.%d.%d' % (_pos // 256 % 256, _pos % 256),
+        'ttl': '300', 'priority': None, 'create_date': '2015-01-01 00:00:00'}
+        for _pos in range(size)]
+
+
+def make_body(size):
+    "Build a list response body (bytes) for a zone"
+    return json.dumps({'records': make_rows(size), 'result': {'code': 100,
+        'message': 'Command Successful'}}).encode('utf-8')
+
+
+def body_decoder(name):
+    "Return a decoder of list response bodies to DNSRecords using codec name"
+    _codec = codec.get_codec(name)
+
+    def _decode(domain, body):
+        _data = parse_result(body, 'list_dns_records', codec=_codec)
+        return list(DNSRecord.from_rows(domain, _data['records']))
+    return _decode
+
+
+def measure(decode, rows):
+    "Return (seconds, bytes allocated) decoding rows"
+    _start = time.perf_counter()
+    decode('test.com', rows)
+    _elapsed = time.perf_counter() - _start
+    tracemalloc.start()
+    _records = decode('test.com', rows)
+    _size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del _records
+    return _elapsed, _size
+
+
+def main(argv=None):
+    _sizes = [int(_arg) for _arg in (argv or sys.argv[1:])] or ZONE_SIZES
+    print(u"%8s %10s %12s %12s %12s" % ('records', 'decoder', 'ms',
+        'KiB', 'bytes/rec'))
+    for _size in _sizes:
+        _rows = make_rows(_size)
+        for _name, _decode in (('legacy', legacy_decode),
+                ('bulk', bulk_decode)):
+            _elapsed, _bytes = measure(_decode, _rows)
+            print(u"%8d %10s %12.2f %12.1f %12.1f" % (_size, _name,
+                _elapsed * 1000, _bytes / 1024.0, float(_bytes) / _size))
+        _body = make_body(_size)
+        for _name in codec.available():
+            _elapsed, _bytes = measure(body_decoder(_name), _body)
+            print(u"%8d %10s %12.2f %12.1f %12.1f" % (_size, _name,
+                _elapsed * 1000, _bytes / 1024.0, float(_bytes) / _size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+# -*- encoding:utf8 -*-
+"""
+    APIName benchmark suite. Runs every APIName method against a local
+    FakeNameServer at several zone sizes and concurrency levels, and
+    reports throughput and latency percentiles. Results are saved as
+    json so runs can be compared to catch regressions.
+
+    Usage:
+      python -m benchmarks.run [--sizes 10,1000] [--concurrency 1,8]
+          [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import platform
+import sys
+import time
+
+from api_name.api import APIName, DNSRecord
+from api_name.batch import BatchOperation
+from api_name.retry import RetryPolicy
+from api_name.testing import FakeNameServer
+from api_name import codec, zonefile
+from benchmarks import bench_records
+
+ZONE_SIZES = (10, 100, 1000, 10000, 100000)
+CONCURRENCY = (1, 4, 16)
+ITERATIONS = 50
+# Max records listed per benchmark case (bounds list benchmarks time)
+LIST_BUDGET = 500000
+# Max update_dns_record calls per case (each one sleeps 0.4s)
+UPDATES = 10
+# Domains looked up at once by get_domains
+DOMAINS = 50
+# Relative slowdown reported as regression
+THRESHOLD = 0.2
+
+DOMAIN = 'bench.com'
+
+
+def percentile(values, pct):
+    "Nearest rank percentile of sorted values"
+    if not values:
+        return 0.0
+    _pos = max(0, min(len(values) - 1, int(round(pct / 100.0 * len(values))) - 1))
+    return values[_pos]
+
+
+def run_case(operation, args_list, concurrency):
+    """
+        Call operation once per args in args_list from concurrency threads
+        * Output:
+         - stats (dict): ops, errors, ops_per_s and latency percentiles (ms)
+    """
+    def _timed(args):
+        _start = time.perf_counter()
+        _ok = operation(*args)
+        return time.perf_counter() - _start, _ok is not False
+
+    _start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as _pool:
+        _samples = list(_pool.map(_timed, args_list))
+    _wall = time.perf_counter() - _start
+    _latencies = sorted(_sample[0] for _sample in _samples)
+    return {'ops': len(_samples),
+        'errors': sum(1 for _sample in _samples if not _sample[1]),
+        'ops_per_s': len(_samples) / _wall if _wall else 0.0,
+        'p50_ms': percentile(_latencies, 50) * 1000,
+        'p90_ms': percentile(_latencies, 90) * 1000,
+        'p99_ms': percentile(_latencies, 99) * 1000}
+
+
+def api_suite(sizes, concurrencies, iterations, latency):
+    """
+        Benchmark every APIName method
+        * Output:
+         - results (dict): case name -> stats
+    """
+    _results = {}
+    _domains = [u'domain%d.%s' % (_pos, DOMAIN) for _pos in range(DOMAINS)]
+    with FakeNameServer(latency=latency) as _server:
+        for _domain in _domains:
+            _server.add_zone(_domain)
+        for _size in sizes:
+            _server.add_zone(DOMAIN, _size)
+            _reads = max(3, min(iterations, LIST_BUDGET // max(_size, 1)))
+            for _concurrency in concurrencies:
+                _api = APIName(url=_server.url, username='bench',
+                    token='bench', pool_size=_concurrency,
+                    retry=RetryPolicy(deadline=None))
+                _zone = _api.list_dns_records(DOMAIN)
+                _ids = [_record.record_id for _record in _zone][:_reads]
+                _cases = [
+                    ('list_dns_records', _api.list_dns_records,
+                        [(DOMAIN,)] * _reads),
+                    ('iter_dns_records', lambda _d: sum(1 for _ in
+                        _api.iter_dns_records(_d)), [(DOMAIN,)] * _reads),
+                    ('get_dns_record', _api.get_dns_record,
+                        [(DOMAIN, _id) for _id in _ids]),
+                    ('find_dns_record', _api.find_dns_record,
+                        [(DOMAIN, _zone.get(_id).content) for _id in _ids]),
+                    ('get_domain', _api.get_domain, [(DOMAIN,)] * iterations),
+                    ('get_domains', lambda _d: _api.get_domains(_d,
+                        max_workers=_concurrency), [(_domains,)] *
+                        max(3, iterations // 10)),
+                    ('update_nameservers', _api.update_nameservers,
+                        [(DOMAIN, ['ns1.name.com', 'ns2.name.com'])] *
+                        iterations),
+                ]
+                for _name, _operation, _args in _cases:
+                    _results[case_name('api', _name, _size, _concurrency)] = \
+                        run_case(_operation, _args, _concurrency)
+
+                # Writes: create records, update some, delete them back
+                _created = []
+
+                def _create(record):
+                    _record = _api.create_dns_record(DOMAIN, record)
+                    if _record:
+                        _created.append(_record)
+                    return _record
+
+                _results[case_name('api', 'create_dns_record', _size,
+                    _concurrency)] = run_case(_create, [(DNSRecord(DOMAIN,
+                        'bench%d' % _pos, 'A', '192.168.%d.%d' % (_pos // 256,
+                        _pos % 256)),) for _pos in range(iterations)],
+                    _concurrency)
+                _updates = min(UPDATES, _reads, len(_created))
+
+                def _update(record):
+                    _record = _api.update_dns_record(DOMAIN, record.content,
+                        record.replace(hostname=record.hostname.split('.')[0],
+                            content=record.content.replace('192.', '172.', 1),
+                            record_id=None))
+                    if _record:
+                        _created.append(_record)
+                    return _record
+
+                _results[case_name('api', 'update_dns_record', _size,
+                    _concurrency)] = run_case(_update, [(_record,) for _record
+                        in _created[:_updates]], _concurrency)
+                del _created[:_updates]
+                _results[case_name('api', 'delete_dns_record', _size,
+                    _concurrency)] = run_case(_api.delete_dns_record,
+                    [(DOMAIN, _record.record_id) for _record in _created],
+                    _concurrency)
+
+                # Bulk writes: a batch of creates, then one of deletes
+                _batch = [BatchOperation.create(DOMAIN, DNSRecord(DOMAIN,
+                    'batch%d' % _pos, 'A', '192.168.%d.%d' % (_pos // 256,
+                    _pos % 256))) for _pos in range(iterations)]
+                _done = []
+
+                def _apply(operations):
+                    _batch_results = _api.apply_batch(operations,
+                        _concurrency, _concurrency)
+                    _done.extend(_result.result for _result in _batch_results
+                        if _result.success)
+                    return len(_done) == len(operations) or False
+
+                _results[case_name('api', 'apply_batch', _size,
+                    _concurrency)] = run_case(_apply, [(_batch,)], 1)
+                _api.apply_batch([BatchOperation.delete(DOMAIN,
+                    _record.record_id) for _record in _done], _concurrency,
+                    _concurrency)
+
+                # Zone sync: no changes (plan only), then add and remove
+                # the same records (creates, then deletes)
+                _current = list(_zone)
+                _grown = _current + [DNSRecord(DOMAIN, 'sync%d' % _pos, 'A',
+                    '192.168.%d.%d' % (_pos // 256, _pos % 256))
+                    for _pos in range(min(iterations, _reads))]
+
+                def _sync(records):
+                    return _api.sync_zone(DOMAIN, records,
+                        max_workers=_concurrency, per_domain=_concurrency)
+
+                _results[case_name('api', 'sync_zone_unchanged', _size,
+                    _concurrency)] = run_case(_sync, [(_current,)] * _reads,
+                    _concurrency)
+                _results[case_name('api', 'sync_zone', _size,
+                    _concurrency)] = run_case(_sync, [(_grown,), (_current,)]
+                    * 2, 1)
+                _api.close()
+            print(u"api suite: %d records done" % _size, file=sys.stderr)
+    return _results
+
+
+def decode_suite(sizes):
+    """
+        Benchmark record decoding and list response decoding per json
+        codec (see bench_records)
+    """
+    _results = {}
+    for _size in sizes:
+        _rows = bench_records.make_rows(_size)
+        _body = bench_records.make_body(_size)
+        _cases = [(_name, _decode, _rows) for _name, _decode in (
+            ('legacy', bench_records.legacy_decode),
+            ('bulk', bench_records.bulk_decode))]
+        _cases.extend(('response-%s' % _name,
+            bench_records.body_decoder(_name), _body)
+            for _name in codec.available())
+        for _name, _decode, _input in _cases:
+            _elapsed, _bytes = bench_records.measure(_decode, _input)
+            _results[case_name('decode', _name, _size, 1)] = {'ops': _size,
+                'ops_per_s': _size / _elapsed if _elapsed else 0.0,
+                'p50_ms': _elapsed * 1000, 'bytes': _bytes}
+    return _results
+
+
+def zone_text(size):
+    "Build a BIND zone file of size A records"
+    _lines = [u"$ORIGIN %s." % DOMAIN, u"$TTL 300"]
+    _lines.extend(u"host%d IN A 10.%d.%d.%d" % (_pos, _pos // 65536 % 256,
+        _pos // 256 % 256, _pos % 256) for _pos in range(size))
+    return u"\n".join(_lines) + u"\n"
+
+
+def zonefile_suite(sizes):
+    """
+        Benchmark zone file import (parse_zone) and export (write_zone)
+    """
+    _results = {}
+    for _size in sizes:
+        _text = zone_text(_size)
+        _start = time.perf_counter()
+        _records = list(zonefile.parse_zone(io.StringIO(_text), DOMAIN))
+        _elapsed = time.perf_counter() - _start
+        _results[case_name('zonefile', 'parse', _size, 1)] = {'ops': _size,
+            'ops_per_s': _size / _elapsed if _elapsed else 0.0,
+            'p50_ms': _elapsed * 1000}
+        _start = time.perf_counter()
+        zonefile.write_zone(_records, io.StringIO(), DOMAIN, 300)
+        _elapsed = time.perf_counter() - _start
+        _results[case_name('zonefile', 'write', _size, 1)] = {'ops': _size,
+            'ops_per_s': _size / _elapsed if _elapsed else 0.0,
+            'p50_ms': _elapsed * 1000}
+    return _results
+
+
+def case_name(suite, name, size, concurrency):
+    return u"%s/%s/size=%d/c=%d" % (suite, name, size, concurrency)
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+        Compare results with a baseline run
+        * Output:
+         - regressions (list): (case, baseline ops/s, ops/s, change)
+    """
+    _regressions = []
+    for _case, _stats in sorted(results.items()):
+        _base = baseline.get(_case)
+        if not _base or not _base.get('ops_per_s'):
+            continue
+        _change = _stats['ops_per_s'] / _base['ops_per_s'] - 1
+        print(u"%-60s %12.1f %12.1f %+7.1f%%" % (_case, _base['ops_per_s'],
+            _stats['ops_per_s'], _change * 100))
+        if _change < -threshold:
+            _regressions.append((_case, _base['ops_per_s'],
+                _stats['ops_per_s'], _change))
+    return _regressions
+
+
+def report(results):
+    print(u"%-60s %8s %12s %10s %10s %10s" % ('case', 'ops', 'ops/s',
+        'p50 ms', 'p90 ms', 'p99 ms'))
+    for _case, _stats in sorted(results.items()):
+        print(u"%-60s %8d %12.1f %10.2f %10.2f %10.2f" % (_case, _stats['ops'],
+            _stats['ops_per_s'], _stats['p50_ms'], _stats.get('p90_ms', 0),
+            _stats.get('p99_ms', 0)))
+
+
+def main(argv=None):
+    _parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n')[0])
+    _parser.add_argument('--sizes', default=','.join(map(str, ZONE_SIZES)),
+        help='comma separated zone sizes')
+    _parser.add_argument('--concurrency',
+        default=','.join(map(str, CONCURRENCY)),
+        help='comma separated concurrency levels')
+    _parser.add_argument('--iterations', type=int, default=ITERATIONS,
+        help='operations per case')
+    _parser.add_argument('--latency', type=float, default=0.0,
+        help='server latency per request (seconds)')
+    _parser.add_argument('--suites', default='api,decode,zonefile',
+        help='comma separated suites (api, decode, zonefile)')
+    _parser.add_argument('--output', help='save results as json')
+    _parser.add_argument('--compare', help='baseline json to compare with')
+    _parser.add_argument('--threshold', type=float, default=THRESHOLD,
+        help='throughput drop reported as regression (0.2)')
+    _args = _parser.parse_args(argv)
+
+    _sizes = [int(_size) for _size in _args.sizes.split(',')]
+    _suites = _args.suites.split(',')
+    _results = {}
+    if 'api' in _suites:
+        _results.update(api_suite(_sizes, [int(_level) for _level in
+            _args.concurrency.split(',')], _args.iterations, _args.latency))
+    if 'decode' in _suites:
+        _results.update(decode_suite(_sizes))
+    if 'zonefile' in _suites:
+        _results.update(zonefile_suite(_sizes))
+    report(_results)
+
+    if _args.output:
+        with open(_args.output, 'w') as _file:
+            json.dump({'meta': {'python': platform.python_version(),
+                'platform': platform.platform(), 'time': time.time(),
+                'latency': _args.latency, 'iterations': _args.iterations},
+                'results': _results}, _file, indent=1, sort_keys=True)
+    if _args.compare:
+        with open(_args.compare) as _file:
+            _regressions = compare(_results, json.load(_file)['results'],
+                _args.threshold)
+        if _regressions:
+            print(u"%d regressions over %d%%" % (len(_regressions),
+                _args.threshold * 100))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
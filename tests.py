@@ -1,7 +1,54 @@
 # -*- encoding: utf-8 -*-
 
+import asyncio
+import json
+import threading
+import time
 import unittest
-from api_name.api import APIName, DNSRecord
+import mock
+from api_name.api import APIName, DNSRecord, RecordSet, POST
+from api_name.batch import BatchOperation
+from api_name.log import configure_logging
+from api_name.metrics import MetricsCollector
+from api_name.cache import ZoneCache
+from api_name.ratelimit import TokenBucket, FileTokenBucket
+from api_name.retry import RetryPolicy
+from api_name.testing import FakeNameServer
+
+try:
+    from aiohttp import web
+    from api_name.aio import AsyncAPIName
+except ImportError:
+    web = None
+
+
+class MockResponse(object):
+    """
+        Mock requests.Response object
+    """
+    def __init__(self, data, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(data).encode('utf-8')
+        self.reason = 'OK'
+
+    def iter_content(self, chunk_size=1):
+        for _pos in range(0, len(self.content), chunk_size):
+            yield self.content[_pos:_pos + chunk_size]
+
+    def close(self):
+        pass
+
+    def __bool__(self):
+        return self.status_code < 400
+    __nonzero__ = __bool__
+
+
+def _ok(**data):
+    "Build a name.com success payload"
+    data['result'] = {'code': 100, 'message': 'Command Successful'}
+    return data
+
 
 class APINameTest(unittest.TestCase):
     """
@@ -30,11 +77,816 @@ class APINameTest(unittest.TestCase):
         for _fd in ['domain', 'hostname', 'content', 'record_id']:
             self.assertEqual(getattr(self.record, _fd), getattr(_record, _fd))
 
+    def test_record_value_semantics(self):
+        "DNSRecord is immutable, hashable and compared by value"
+        _copy = DNSRecord(domain=self.domain, hostname='www.test.com',
+            content='test2.com', record_id='1')
+        self.assertEqual(self.record, _copy)
+        self.assertEqual(len(set([self.record, _copy])), 1)
+        self.assertRaises(AttributeError, setattr, self.record, 'ttl', 60)
+        self.assertEqual(self.record.replace(ttl=60).ttl, 60)
+        self.assertNotEqual(self.record.replace(ttl=60), self.record)
+        import pickle
+        self.assertEqual(pickle.loads(pickle.dumps(self.record)), self.record)
+
+    def test_records_from_rows(self):
+        "Bulk decoding leaves rows untouched"
+        _rows = [{'record_id': '1', 'name': 'www.test.com', 'type': 'CNAME',
+            'content': 'test2.com', 'ttl': 300, 'priority': None}]
+        _records = list(DNSRecord.from_rows(self.domain, _rows))
+        self.assertEqual(_records, [self.record])
+        self.assertEqual(sorted(_rows[0]), ['content', 'name', 'priority',
+            'record_id', 'ttl', 'type'])
+
+    def test_record_set(self):
+        "RecordSet indexed and compound lookups"
+        _records = RecordSet([
+            DNSRecord(self.domain, 'www', 'A', '10.0.0.1', record_id='1'),
+            DNSRecord(self.domain, 'www', 'AAAA', '::1', record_id='2'),
+            DNSRecord(self.domain, 'mail', 'A', '10.0.0.1', record_id='3')])
+        self.assertEqual(len(_records), 3)
+        self.assertEqual(_records.get('2').content, '::1')
+        self.assertIsNone(_records.get('4'))
+        self.assertEqual([_r.record_id for _r in
+            _records.find(content='10.0.0.1')], ['1', '3'])
+        self.assertEqual([_r.record_id for _r in
+            _records.find(hostname='www', rtype='A')], ['1'])
+        self.assertEqual(_records.find(hostname='ftp'), [])
+        self.assertEqual(_records.remove('1').record_id, '1')
+        self.assertEqual([_r.record_id for _r in
+            _records.find(content='10.0.0.1')], ['3'])
+        self.assertEqual(_records[0].record_id, '2')
+        # Copies share index buckets until one of them changes
+        _copy = _records.copy()
+        _copy.add(DNSRecord(self.domain, 'mail', 'A', '10.0.0.2',
+            record_id='4'))
+        _copy.remove('3')
+        _records.add(DNSRecord(self.domain, 'www', 'A', '10.0.0.1',
+            record_id='5'))
+        self.assertEqual([_r.record_id for _r in _copy.find(hostname='mail')],
+            ['4'])
+        self.assertEqual([_r.record_id for _r in
+            _records.find(hostname='mail')], ['3'])
+        self.assertEqual([_r.record_id for _r in
+            _records.find(hostname='www')], ['2', '5'])
+        self.assertEqual([_r.record_id for _r in _copy], ['2', '4'])
+
     ##############################################################
     # APIName tests
     ##############################################################
+    def test_pooled_transport(self):
+        "Requests go through the instance transport"
+        _transport = mock.Mock()
+        _transport.request.return_value = MockResponse(_ok(records=[]))
+        with APIName(username='foo', token='bar', transport=_transport) as api:
+            api.list_dns_records(self.domain)
+            api.update_nameservers(self.domain, ['ns1.test.com'])
+        self.assertEqual(_transport.request.call_count, 2)
+        self.assertEqual(_transport.request.call_args[0][0], POST)
+        # Shared transports are not closed by the client
+        self.assertFalse(_transport.close.called)
+
+    def test_json_codecs(self):
+        "Every installed json codec decodes responses from bytes"
+        from api_name import codec
+        self.assertEqual(codec.available()[-1], 'json')
+        self.assertRaises(ValueError, codec.get_codec, 'missing')
+        _row = {'record_id': '1', 'name': u'www.test.com', 'type': 'A',
+            'content': u'10.0.0.1', 'ttl': '300', 'priority': None}
+        for _name in codec.available():
+            _codec = codec.get_codec(_name)
+            self.assertEqual(_codec.loads(_codec.dumps(_row)), _row)
+            _transport = mock.Mock()
+            _transport.request.return_value = MockResponse(_ok(**_row))
+            api = APIName(username='foo', token='bar', transport=_transport,
+                codec=_codec)
+            _record = api.create_dns_record(self.domain, self.record)
+            self.assertEqual(_record.content, '10.0.0.1')
+            self.assertEqual(json.loads(_transport.request.call_args[1][
+                'data']), self.record.post_data())
+
+    def test_owned_transport_closed(self):
+        "Owned transport is closed with the client"
+        api = APIName(username='foo', token='bar', pool_size=2)
+        with mock.patch.object(api.conn, 'close') as _close:
+            api.close()
+        self.assertTrue(_close.called)
+
+    def test_zone_cache(self):
+        "Zone listings are cached and kept consistent on writes"
+        _row = {'record_id': '1', 'name': 'www.test.com', 'type': 'A',
+            'content': '10.0.0.1', 'ttl': 300, 'priority': None}
+        _created = dict(_row, record_id='2', name='api.test.com')
+        _transport = mock.Mock()
+        _transport.request.side_effect = [
+            MockResponse(_ok(records=[_row])), MockResponse(_ok(**_created)),
+            MockResponse(_ok())]
+        _cache = ZoneCache(ttl=60, max_size=2)
+        api = APIName(username='foo', token='bar', transport=_transport,
+            cache=_cache)
+        _listed = api.list_dns_records(self.domain)
+        self.assertEqual(len(_listed), 1)
+        self.assertEqual(api.get_dns_record(self.domain, '1').content,
+            '10.0.0.1')
+        api.create_dns_record(self.domain, self.record)
+        self.assertEqual(len(api.list_dns_records(self.domain)), 2)
+        # Listings handed out before a write are not changed under readers
+        self.assertEqual(len(_listed), 1)
+        self.assertTrue(api.delete_dns_record(self.domain, '1'))
+        self.assertEqual([_r.record_id for _r in
+            api.list_dns_records(self.domain)], ['2'])
+        self.assertEqual(_transport.request.call_count, 3)
+        self.assertEqual(_cache.stats()['misses'], 1)
+        self.assertEqual(_cache.stats()['hits'], 3)
+
+    def test_zone_cache_write_race(self):
+        "A listing overtaken by a write is not cached over it"
+        _row = {'record_id': '1', 'name': 'www.test.com', 'type': 'A',
+            'content': '10.0.0.1', 'ttl': 300, 'priority': None}
+        _zone = [_row]
+        _listing, _release = threading.Event(), threading.Event()
+
+        def _request(method, url, **params):
+            if '/dns/create/' in url:
+                _zone.append(dict(_row, record_id='2', name='api.test.com'))
+                return MockResponse(_ok(**_zone[-1]))
+            # The listing is taken now, answered once released
+            _response = MockResponse(_ok(records=list(_zone)))
+            _listing.set()
+            _release.wait(5)
+            return _response
+
+        _transport = mock.Mock()
+        _transport.request.side_effect = _request
+        api = APIName(username='foo', token='bar', transport=_transport,
+            cache=ZoneCache(ttl=60))
+        _reader = threading.Thread(target=api.list_dns_records,
+            args=(self.domain,))
+        _reader.start()
+        _listing.wait(5)
+        self.assertEqual(api.create_dns_record(self.domain,
+            self.record).record_id, '2')
+        _release.set()
+        _reader.join(5)
+        self.assertEqual([_r.record_id for _r in
+            api.list_dns_records(self.domain)], ['1', '2'])
+
+    def test_zone_cache_eviction(self):
+        "Zone cache expires entries and evicts least recently used"
+        _now = [0]
+        _cache = ZoneCache(ttl=10, max_size=2, clock=lambda: _now[0])
+        for _domain in ('a.com', 'b.com', 'c.com'):
+            _cache.set(_domain, RecordSet())
+        self.assertIsNone(_cache.get('a.com'))
+        self.assertEqual(_cache.get('c.com'), [])
+        _now[0] = 11
+        self.assertIsNone(_cache.get('c.com'))
+        self.assertEqual(_cache.stats()['evictions'], 1)
+
+    def test_iter_dns_records(self):
+        "Records are streamed while the body is parsed"
+        _rows = [{'record_id': str(_id), 'name': 'h%d.test.com' % _id,
+            'type': 'A', 'content': '10.0.0.%d' % _id, 'ttl': 300}
+            for _id in range(20)]
+        _transport = mock.Mock()
+        _transport.request.return_value = MockResponse(_ok(records=_rows))
+        api = APIName(username='foo', token='bar', transport=_transport)
+        _records = list(api.iter_dns_records(self.domain, chunk_size=7))
+        self.assertEqual([_r.record_id for _r in _records],
+            [_row['record_id'] for _row in _rows])
+        self.assertTrue(_transport.request.call_args[1]['stream'])
+
+        # Envelope before the records: nothing is yielded on error, the
+        # error is logged and reported once
+        _metrics = MetricsCollector()
+        api = APIName(username='foo', token='bar', transport=_transport,
+            observers=[_metrics])
+        _transport.request.return_value = MockResponse({'result': {
+            'code': 251, 'message': 'Domain not found'}, 'records': _rows})
+        with self.assertLogs('api_name.api', 'ERROR') as _logs:
+            self.assertEqual(list(api.iter_dns_records(self.domain)), [])
+        self.assertEqual(len(_logs.records), 1)
+        self.assertEqual(_metrics.codes[('iter_dns_records', '251')], 1)
+        # Envelope after the records: they are yielded, the error logged
+        _transport.request.return_value = MockResponse({'records': _rows,
+            'result': {'code': 251, 'message': 'Domain not found'}})
+        with self.assertLogs('api_name.api', 'ERROR') as _logs:
+            self.assertEqual(len(list(api.iter_dns_records(self.domain))), 20)
+        self.assertEqual(len(_logs.records), 1)
+        self.assertIn('Error 251 in iter_dns_records', _logs.output[0])
+        self.assertEqual(_metrics.codes[('iter_dns_records', '251')], 2)
+
+    def test_stream_chunk_boundaries(self):
+        "Numbers split across chunks are decoded whole"
+        from api_name.stream import iter_array
+        _body = b'{"records":[1,-2.5e3,{"a":1.25}],"total":12,"result":1.5}'
+        for _size in (1, 2, 3, 4, 7):
+            _envelope = {}
+            self.assertEqual(list(iter_array([_body[_pos:_pos + _size]
+                for _pos in range(0, len(_body), _size)], 'records',
+                _envelope)), [1, -2500.0, {'a': 1.25}])
+            self.assertEqual(_envelope, {'total': 12, 'result': 1.5})
+
+    def test_retry_policy(self):
+        "Retries honour Retry-After, timeouts and the call deadline"
+        _now = [0.0]
+        _sleeps = []
+
+        def _sleep(seconds):
+            _sleeps.append(seconds)
+            _now[0] += seconds
+
+        _policy = RetryPolicy(connect_timeout=2, read_timeout=10,
+            max_attempts=4, backoff=1, jitter=False, deadline=12,
+            clock=lambda: _now[0], sleep=_sleep)
+        _transport = mock.Mock()
+        _transport.request.side_effect = [
+            MockResponse({}, 503, {'Retry-After': '3'}),
+            MockResponse({}, 502), MockResponse(_ok(records=[]))]
+        api = APIName(username='foo', token='bar', transport=_transport,
+            retry=_policy)
+        self.assertEqual(api.list_dns_records(self.domain), [])
+        self.assertEqual(_sleeps, [3.0, 2])
+        self.assertEqual(_transport.request.call_args_list[0][1]['timeout'],
+            (2, 10))
+        self.assertEqual(_transport.request.call_args_list[2][1]['timeout'],
+            (2, 7.0))
+
+        # Not retryable status: no retries at all
+        _transport.request.side_effect = [MockResponse({}, 404)]
+        self.assertEqual(api.list_dns_records(self.domain), [])
+        # Delete retries share one deadline with request retries
+        _now[0], _sleeps[:] = 0.0, []
+        _transport.request.side_effect = None
+        _transport.request.return_value = MockResponse({}, 503)
+        self.assertFalse(api.delete_dns_record(self.domain, '1'))
+        self.assertLessEqual(sum(_sleeps), 12)
+
+    def test_token_bucket(self):
+        "Token bucket allows bursts, then paces to the rate"
+        _now = [0.0]
+
+        def _sleep(seconds):
+            _now[0] += seconds
+
+        _bucket = TokenBucket(rate=2, burst=3, clock=lambda: _now[0],
+            sleep=_sleep)
+        for _ in range(3):
+            self.assertEqual(_bucket.reserve(), 0.0)
+        self.assertEqual(_bucket.reserve(), 0.5)
+        self.assertTrue(_bucket.acquire())
+        self.assertEqual(_now[0], 0.5)
+        self.assertFalse(_bucket.acquire(timeout=0.1))
+
+    def test_fractional_token_bucket(self):
+        "Rates below one request per second still hold one token"
+        _now = [0.0]
+
+        def _sleep(seconds):
+            _now[0] += seconds
+
+        _bucket = TokenBucket(rate=0.5, clock=lambda: _now[0], sleep=_sleep)
+        self.assertEqual(_bucket.reserve(), 0.0)
+        self.assertEqual(_bucket.reserve(), 2.0)
+        self.assertTrue(_bucket.acquire())
+        self.assertEqual(_now[0], 2.0)
+        self.assertRaises(ValueError, _bucket.reserve, 2)
+
+    def test_file_token_bucket(self):
+        "File token bucket state is shared by every instance"
+        import tempfile
+        with tempfile.NamedTemporaryFile() as _file:
+            _first = FileTokenBucket(_file.name, rate=1, burst=2)
+            _second = FileTokenBucket(_file.name, rate=1, burst=2)
+            self.assertEqual(_first.reserve(), 0.0)
+            self.assertEqual(_second.reserve(), 0.0)
+            self.assertGreater(_first.reserve(), 0.0)
+
+    def test_rate_limited_requests(self):
+        "Requests take a token before every attempt"
+        _limiter = mock.Mock()
+        _limiter.acquire.return_value = True
+        _transport = mock.Mock()
+        _transport.request.return_value = MockResponse(_ok(records=[]))
+        api = APIName(username='foo', token='bar', transport=_transport,
+            rate_limiter=_limiter)
+        api.list_dns_records(self.domain)
+        self.assertEqual(_limiter.acquire.call_count, 1)
+        _limiter.acquire.return_value = False
+        self.assertEqual(api.list_dns_records(self.domain), [])
+        self.assertEqual(_transport.request.call_count, 1)
+
+    def test_structured_logging(self):
+        "Logging is opt-in, queued and carries structured fields"
+        import logging
+        import logging.handlers
+        self.assertEqual([type(_h) for _h in logging.getLogger(
+            'api_name').handlers], [logging.NullHandler])
+        _records = []
+
+        class _Handler(logging.Handler):
+            def emit(self, record):
+                _records.append((record, self.format(record)))
+
+        _logger = logging.getLogger('api_name')
+        configure_logging(_Handler()).stop()
+        _listener = configure_logging(_Handler())
+        try:
+            # Reconfiguring replaces the queue, records skip root handlers
+            self.assertEqual([type(_h) for _h in _logger.handlers],
+                [logging.NullHandler, logging.handlers.QueueHandler])
+            self.assertFalse(_logger.propagate)
+            _transport = mock.Mock()
+            _transport.request.return_value = MockResponse({}, 404)
+            api = APIName(username='foo', token='bar', transport=_transport)
+            api.list_dns_records(self.domain)
+        finally:
+            _listener.stop()
+            _logger.handlers = _logger.handlers[:1]
+            _logger.propagate = True
+        _record, _line = _records[-1]
+        self.assertEqual((_record.method, _record.domain, _record.attempt,
+            _record.status_code), ('GET', self.domain, 1, 404))
+        self.assertIn('status_code=404', _line)
+
+    def test_metrics_collector(self):
+        "Observers get request, call, retry and result code metrics"
+        _metrics = MetricsCollector()
+        _transport = mock.Mock()
+        _transport.request.side_effect = [MockResponse({}, 503),
+            MockResponse(_ok(records=[])), MockResponse({'result': {
+                'code': 251, 'message': 'Not found'}}), MockResponse(_ok())]
+        api = APIName(username='foo', token='bar', transport=_transport,
+            retry=RetryPolicy(backoff=0, jitter=False), observers=[_metrics])
+        api.list_dns_records(self.domain)
+        self.assertFalse(api.get_domain(self.domain))
+        self.assertTrue(api.update_nameservers(self.domain, ['ns1.test.com']))
+        _text = api.observers[0].render()
+        for _line in (
+                'apiname_call_duration_seconds_count{action="get_domain"} 1',
+                'apiname_request_duration_seconds_count{endpoint="/dns/list"} 1',
+                'apiname_requests_total{endpoint="/domain/get",status="200"} 1',
+                'apiname_retries_total{action="list_dns_records",'
+                'endpoint="/dns/list"} 1',
+                'apiname_result_codes_total{action="get_domain",code="251"} 1',
+                'apiname_result_codes_total{action="update_nameservers",'
+                'code="100"} 1'):
+            self.assertIn(_line, _text)
+
+    def test_apply_batch(self):
+        "Batch operations run per domain and report per item results"
+        api = APIName(username='foo', token='bar', transport=mock.Mock())
+        _calls = []
+
+        def _create(domain, record):
+            _calls.append(domain)
+            return record if record.content else False
+
+        _ops = [BatchOperation.create(_domain, DNSRecord(_domain, 'www',
+            'A', _content)) for _domain, _content in (('a.com', '10.0.0.1'),
+            ('b.com', None), ('a.com', '10.0.0.2'))]
+        _ops.append(BatchOperation.delete('c.com', '7'))
+        with mock.patch.object(api, 'create_dns_record', side_effect=_create), \
+                mock.patch.object(api, 'delete_dns_record',
+                    side_effect=RuntimeError('boom')):
+            _results = api.apply_batch(_ops, max_workers=2, per_domain=1)
+        self.assertEqual([_r.operation for _r in _results], _ops)
+        self.assertEqual([_r.success for _r in _results],
+            [True, False, True, False])
+        self.assertIsInstance(_results[3].error, RuntimeError)
+        self.assertEqual(sorted(_calls), ['a.com', 'a.com', 'b.com'])
+
+    def test_sync_zone(self):
+        "Zone sync issues creates before deletes and supports dry run"
+        _rows = [{'record_id': _id, 'name': _name, 'type': 'A',
+            'content': _content, 'ttl': '300', 'priority': None}
+            for _id, _name, _content in (('1', 'www.test.com', '10.0.0.1'),
+                ('2', 'test.com', '10.0.0.9'), ('3', 'old.test.com', '10.0.0.5'))]
+        _desired = [DNSRecord(self.domain, 'www', 'A', '10.0.0.1'),
+            DNSRecord(self.domain, '', 'A', '10.0.0.2')]
+        _transport = mock.Mock()
+        _transport.request.return_value = MockResponse(_ok(records=_rows))
+        api = APIName(username='foo', token='bar', transport=_transport)
+        _plan = api.sync_zone(self.domain, _desired, dry_run=True)
+        self.assertEqual([_r.content for _r in _plan.creates], ['10.0.0.2'])
+        self.assertEqual(sorted(_r.record_id for _r in _plan.deletes),
+            ['2', '3'])
+        self.assertEqual(_plan.results, [])
+        self.assertEqual(_transport.request.call_count, 1)
+
+        _calls = []
+        with mock.patch.object(api, 'create_dns_record',
+                side_effect=lambda _d, _r: _calls.append('create') or _r), \
+                mock.patch.object(api, 'delete_dns_record',
+                side_effect=lambda _d, _i: _calls.append('delete') or True):
+            _plan = api.sync_zone(self.domain, _desired)
+        self.assertEqual(_calls, ['create', 'delete', 'delete'])
+        self.assertTrue(all(_r.success for _r in _plan.results))
+
+    def test_zone_file(self):
+        "BIND zone files are parsed to records and written back"
+        import io
+        from api_name.zonefile import parse_zone, write_zone
+        _zone = (u'$ORIGIN test.com.\n$TTL 1h\n'
+            u'@ IN SOA ns1 admin (\n  1 3600 900 604800 300 ) ; soa\n'
+            u'@ IN MX 10 mail\n'
+            u'www 300 IN A 10.0.0.1\n'
+            u'    IN AAAA ::1 ; same owner\n'
+            u'ftp IN 1d CNAME www\n'
+            u'txt TXT "v=spf1 ~all" "\\"quoted\\""\n'
+            u'_sip._tcp SRV 10 60 5060 sip.other.com.\n'
+            u'$ORIGIN sub.test.com.\n'
+            u'a A 10.0.0.3\n')
+        _records = list(parse_zone(io.StringIO(_zone), chunk_size=8))
+        self.assertEqual([(_r.hostname, _r.rtype, _r.content, _r.ttl,
+            _r.priority) for _r in _records], [
+            ('', 'MX', 'mail.test.com', 3600, 10),
+            ('www', 'A', '10.0.0.1', 300, None),
+            ('www', 'AAAA', '::1', 3600, None),
+            ('ftp', 'CNAME', 'www.test.com', 86400, None),
+            ('txt', 'TXT', 'v=spf1 ~all"quoted"', 3600, None),
+            ('_sip._tcp', 'SRV', '60 5060 sip.other.com', 3600, 10),
+            ('a.sub', 'A', '10.0.0.3', 3600, None)])
+        self.assertEqual(_records[0].domain, self.domain)
+
+        _output = io.StringIO()
+        self.assertEqual(write_zone(_records, _output, self.domain, 3600), 7)
+        self.assertEqual(_output.getvalue().splitlines()[2],
+            u'@ 3600 IN MX 10 mail.test.com.')
+        _output.seek(0)
+        self.assertEqual(list(parse_zone(_output)), _records)
+        # API rows have absolute hostnames
+        _output = io.StringIO()
+        write_zone([DNSRecord(self.domain, 'www.test.com', 'A', '10.0.0.1',
+            '300')], _output, self.domain)
+        self.assertEqual(_output.getvalue(),
+            u'$ORIGIN test.com.\nwww 300 IN A 10.0.0.1\n')
+        self.assertRaises(ValueError, list, parse_zone(
+            io.StringIO(u'www IN A 10.0.0.1\n')))
+        self.assertRaises(ValueError, list, parse_zone(
+            io.StringIO(u'$INCLUDE other.zone\n'), self.domain))
+
+
+class FakeServerTest(unittest.TestCase):
+    """
+        APIName end to end tests against the local name.com stand-in
+    """
+    def setUp(self):
+        self.domain = 'test.com'
+        self.server = FakeNameServer().start()
+        self.server.add_zone(self.domain, 3)
+        self.api = APIName(url=self.server.url, username='foo', token='bar',
+            retry=RetryPolicy(backoff=0.01))
+
+    def tearDown(self):
+        self.api.close()
+        self.server.stop()
+
+    def test_dns_records(self):
+        "List, create, update and delete records"
+        self.assertEqual(len(self.api.list_dns_records(self.domain)), 3)
+        _record = self.api.create_dns_record(self.domain,
+            DNSRecord(self.domain, 'www', 'A', '192.168.0.1'))
+        self.assertEqual(_record.hostname, 'www.test.com')
+        self.assertTrue(self.api.update_dns_record(self.domain, '192.168.0.1',
+            DNSRecord(self.domain, 'www', 'A', '192.168.0.2')))
+        self.assertEqual(self.api.find_dns_record(self.domain, '192.168.0.1'),
+            [])
+        _found = self.api.find_dns_record(self.domain, '192.168.0.2')
+        self.assertTrue(self.api.delete_dns_record(self.domain,
+            _found[0].record_id))
+        self.assertEqual(len(self.api.list_dns_records(self.domain)), 3)
+        self.assertEqual(self.server.count('/dns/create'), 2)
+
+    def test_domains(self):
+        "Get domains and update nameservers"
+        self.assertTrue(self.api.get_domain(self.domain))
+        self.assertFalse(self.api.get_domain('missing.com'))
+        self.assertTrue(self.api.update_nameservers(self.domain,
+            ['ns1.test.com']))
+        self.assertEqual(self.api.get_domain(self.domain,
+            check=False)['nameservers'], ['ns1.test.com'])
+
+    def test_get_domains(self):
+        "Bulk domain lookups cache found and missing domains"
+        from api_name.cache import DomainCache
+        self.server.add_zone('other.com')
+        api = APIName(url=self.server.url, transport=self.api.conn,
+            domain_cache=DomainCache())
+        _domains = [self.domain, 'missing.com', 'other.com', self.domain]
+        self.assertEqual(list(api.get_domains(_domains).items()),
+            [(self.domain, True), ('missing.com', False), ('other.com', True)])
+        self.assertEqual(self.server.count('/domain/get'), 3)
+        self.assertEqual(api.get_domains(_domains, check=False)['other.com'][
+            'nameservers'], ['ns1.name.com', 'ns2.name.com'])
+        self.assertFalse(api.get_domain('missing.com'))
+        self.assertEqual(self.server.count('/domain/get'), 3)
+        # Nameserver updates refresh the cached info, errors are not cached
+        self.assertTrue(api.update_nameservers('other.com', ['ns1.test.com']))
+        self.assertEqual(api.get_domain('other.com', check=False)[
+            'nameservers'], ['ns1.test.com'])
+        self.server.fail_next(1, 500)
+        api.retry = RetryPolicy(max_attempts=1)
+        self.assertFalse(api.get_domain('new.com'))
+        self.assertIsNone(api.domain_cache.get('new.com'))
+
+    def test_coalesced_reads(self):
+        "Concurrent identical reads share one request"
+        import threading
+        self.server.latency = 0.2
+        api = APIName(url=self.server.url, username='foo', token='bar',
+            coalesce=True, pool_size=8)
+        _results = []
+        _barrier = threading.Barrier(8)
+
+        def _read():
+            _barrier.wait()
+            _results.append((len(api.list_dns_records(self.domain)),
+                api.get_domain(self.domain)))
+
+        _threads = [threading.Thread(target=_read) for _ in range(8)]
+        for _thread in _threads:
+            _thread.start()
+        for _thread in _threads:
+            _thread.join()
+        api.close()
+        self.assertEqual(_results, [(3, True)] * 8)
+        self.assertEqual(self.server.count('/dns/list'), 1)
+        self.assertEqual(self.server.count('/domain/get'), 1)
+        self.assertEqual(api.flights.stats()['shared'], 14)
+
+    def test_zone_watcher(self):
+        "Watcher only emits events for changed records"
+        from api_name.watcher import ZoneWatcher
+        self.server.add_zone('other.com', 2)
+        _watcher = ZoneWatcher(self.api, [self.domain, 'other.com'])
+        self.assertEqual(_watcher.poll(self.domain), [])
+        self.assertEqual(_watcher.poll(self.domain), [])
+        _zone = self.server.zones[self.domain]
+        _zone['1'] = dict(_zone['1'], content='172.16.0.1')
+        del _zone['2']
+        self.server._listings.clear()
+        _record = self.api.create_dns_record(self.domain,
+            DNSRecord(self.domain, 'www', 'A', '192.168.0.1'))
+        _events = _watcher.poll(self.domain)
+        self.assertEqual(sorted((_e.kind, _e.record_id) for _e in _events),
+            [('added', _record.record_id), ('changed', '1'), ('removed', '2')])
+        self.assertIsNone(_watcher.poll('missing.com'))
+
+        _events = []
+        _watcher = self.api.watch_zones([self.domain, 'other.com'],
+            interval=0.05, callback=_events.append)
+        time.sleep(0.2)
+        self.api.create_dns_record('other.com',
+            DNSRecord('other.com', 'www', 'A', '192.168.0.1'))
+        time.sleep(0.3)
+        _watcher.stop()
+        self.assertEqual([(_e.kind, _e.domain) for _e in _events],
+            [('added', 'other.com')])
+
+    def test_zone_store(self):
+        "Zone snapshots are shared on disk between clients"
+        import os
+        import shutil
+        import tempfile
+        from api_name.store import ZoneStore
+        _dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, _dir)
+        _path = os.path.join(_dir, 'zones.db')
+        _clock = mock.Mock(return_value=1000.0)
+        with ZoneStore(_path, max_age=60, clock=_clock) as _store:
+            self.assertEqual(len(APIName(url=self.server.url, store=_store,
+                transport=self.api.conn).list_dns_records(self.domain)), 3)
+            _fetched, _hash = _store.info(self.domain)
+            self.assertEqual(_fetched, 1000.0)
+        # Another process starts warm from the same file
+        with ZoneStore(_path, max_age=60, clock=_clock) as _store:
+            api = APIName(url=self.server.url, store=_store,
+                transport=self.api.conn)
+            self.assertEqual(len(api.list_dns_records(self.domain)), 3)
+            self.assertEqual(len(list(api.iter_dns_records(self.domain))), 3)
+            self.assertEqual(self.server.count('/dns/list'), 1)
+            # Stale snapshots are fetched again, same content same hash
+            _clock.return_value = 1060.0
+            self.assertEqual(len(api.list_dns_records(self.domain)), 3)
+            self.assertEqual(self.server.count('/dns/list'), 2)
+            self.assertEqual(_store.info(self.domain), (1060.0, _hash))
+            # Writes drop the snapshot
+            self.assertTrue(api.create_dns_record(self.domain,
+                DNSRecord(self.domain, 'www', 'A', '192.168.0.1')))
+            self.assertIsNone(_store.info(self.domain))
+            # Listings requested before the write are not stored
+            self.assertIsNone(_store.put(self.domain, [], since=1059.0))
+            self.assertIsNone(_store.info(self.domain))
+            _clock.return_value = 1061.0
+            self.assertEqual(len(api.list_dns_records(self.domain)), 4)
+            self.assertNotEqual(_store.info(self.domain)[1], _hash)
+            self.assertIsNone(_store.put(self.domain, [], since=1060.5))
+            self.assertEqual(len(api.list_dns_records(self.domain)), 4)
+
+    def test_cli(self):
+        "apiname runs JSONL and CSV operations, one result per line"
+        import io
+        from api_name import cli
+        _argv = ['--url', self.server.url, '--username', 'foo', '--token',
+            'bar', '--workers', '2', '--window', '2']
+        _stdin = io.StringIO(u'\n'.join([
+            json.dumps({'action': 'create', 'domain': self.domain,
+                'hostname': 'www', 'type': 'A', 'content': '192.168.0.1'}),
+            json.dumps({'action': 'delete', 'domain': self.domain,
+                'record_id': '1'}),
+            u'{"action": "rename"}',
+            json.dumps({'action': 'update', 'domain': self.domain,
+                'old_content': '192.168.0.1', 'hostname': 'www',
+                'type': 'A', 'content': '192.168.0.2', 'ttl': '600'}),
+        ]))
+        _stdout = io.StringIO()
+        self.assertEqual(cli.main(_argv, _stdin, _stdout), 1)
+        _lines = [json.loads(_line) for _line in
+            _stdout.getvalue().splitlines()]
+        self.assertEqual([(_line['line'], _line['success']) for _line in
+            _lines], [(1, True), (2, True), (3, False), (4, True)])
+        self.assertEqual(_lines[1]['record_id'], '1')
+        self.assertEqual(_lines[2]['error'], u'Missing domain')
+        self.assertEqual(len(self.api.find_dns_record(self.domain,
+            '192.168.0.2')), 1)
+
+        _stdin = io.StringIO(u'action,domain,hostname,type,content,record_id\n'
+            u'delete,test.com,,,,2\ncreate,test.com,mail,MX,10.0.0.1,\n')
+        _stdout = io.StringIO()
+        self.assertEqual(cli.main(_argv + ['--format', 'csv', '--unordered'],
+            _stdin, _stdout), 0)
+        self.assertEqual(sorted(json.loads(_line)['line'] for _line in
+            _stdout.getvalue().splitlines()), [2, 3])
+
+    def test_account_pool(self):
+        "Domains are routed to the account owning them"
+        from api_name.cache import DomainCache
+        from api_name.pool import APINamePool, Account
+        _other = FakeNameServer().start()
+        self.addCleanup(_other.stop)
+        _other.add_zone('other.com', 2)
+        _other.add_zone('third.com', 1)
+        with APINamePool([
+                Account('main', 'foo', 'bar', self.server.url,
+                    domains=[self.domain], concurrency=2),
+                Account('reseller', 'foo', 'bar', _other.url, rate=100)],
+                retry=RetryPolicy(backoff=0.01),
+                domain_cache=DomainCache()) as _pool:
+            self.assertEqual(_pool.route(self.domain), 'main')
+            self.assertEqual(_pool.route('other.com'), 'reseller')
+            self.assertIsNone(_pool.route('missing.com'))
+            # Discovered routes are kept
+            self.assertEqual(_pool.route('other.com'), 'reseller')
+            self.assertEqual(self.server.count('/domain/get'), 2)
+            # Domains missing in an account are only cached for it
+            self.assertIsNot(_pool.members['main'].api.domain_cache,
+                _pool.members['reseller'].api.domain_cache)
+            _zones = _pool.list_all([self.domain, 'other.com', 'third.com'])
+            self.assertEqual([(_domain, len(_zone)) for _domain, _zone in
+                _zones.items()], [(self.domain, 3), ('other.com', 2),
+                ('third.com', 1)])
+            self.assertTrue(_pool.create_dns_record('other.com',
+                DNSRecord('other.com', 'www', 'A', '192.168.0.1')))
+            self.assertEqual(len(list(_pool.iter_dns_records('other.com'))),
+                3)
+            self.assertFalse(_pool.delete_dns_record('missing.com', '1'))
+        self.assertEqual(self.server.count('/dns/list'), 1)
+        self.assertEqual(_other.count('/dns/create'), 1)
+
+    def test_write_behind(self):
+        "Queued updates of a hostname are coalesced, latest one applied"
+        _queue = self.api.write_behind(delay=0.1)
+        _futures = [_queue.update(self.domain, DNSRecord(self.domain, 'www',
+            'A', '192.168.0.%d' % _pos)) for _pos in range(5)]
+        _mail = _queue.update(self.domain, DNSRecord(self.domain,
+            'mail.test.com', 'A', '192.168.1.1'))
+        self.assertTrue(_queue.flush(timeout=5))
+        _record = _futures[-1].result()
+        self.assertEqual(_record.content, '192.168.0.4')
+        self.assertEqual([_future.result() for _future in _futures],
+            [_record] * 5)
+        self.assertTrue(_mail.result())
+        self.assertEqual(self.server.count('/dns/list'), 1)
+        self.assertEqual(self.server.count('/dns/create'), 2)
+
+        # Replaces the current record, unchanged content is not written
+        _new = _queue.update(self.domain, DNSRecord(self.domain, 'www', 'A',
+            '192.168.0.9'))
+        _same = _queue.update(self.domain, DNSRecord(self.domain, 'mail',
+            'A', '192.168.1.1'))
+        _queue.close()
+        self.assertEqual(_new.result(timeout=5).content, '192.168.0.9')
+        self.assertEqual(_same.result(), _mail.result())
+        self.assertEqual([_r.content for _r in self.api.list_dns_records(
+            self.domain).find(hostname='www.test.com')], ['192.168.0.9'])
+        self.assertEqual(self.server.count('/dns/create'), 3)
+        self.assertEqual(self.server.count('/dns/delete'), 1)
+        self.assertEqual(_queue.stats()['coalesced'], 4)
+        self.assertRaises(RuntimeError, _queue.update, self.domain, _record)
+
+    def test_injected_errors(self):
+        "Http errors are retried, result code errors are not"
+        self.server.fail_next(2, 503)
+        self.assertEqual(len(self.api.list_dns_records(self.domain)), 3)
+        self.assertEqual(self.server.count('/dns/list'), 3)
+        self.server.fail_next(1)
+        self.assertFalse(self.api.get_domain(self.domain))
+        # Creation is not idempotent: a failed status is not retried
+        self.server.fail_next(1, 503)
+        self.assertFalse(self.api.create_dns_record(self.domain,
+            DNSRecord(self.domain, 'www', 'A', '192.168.0.1')))
+        self.assertEqual(self.server.count('/dns/create'), 1)
+        self.assertEqual(len(self.api.list_dns_records(self.domain)), 3)
+
+    def test_failed_stream_released(self):
+        "A failed streamed request gives its pooled connection back"
+        _api = APIName(url=self.server.url, username='foo', token='bar',
+            pool_size=1, retry=RetryPolicy(backoff=0.01))
+        self.addCleanup(_api.close)
+        self.server.fail_next(1, 404)
+        self.assertEqual(list(_api.iter_dns_records(self.domain)), [])
+        _result = []
+        _thread = threading.Thread(target=lambda: _result.append(
+            _api.list_dns_records(self.domain)))
+        _thread.daemon = True
+        _thread.start()
+        _thread.join(5)
+        self.assertFalse(_thread.is_alive())
+        self.assertEqual(len(_result[0]), 3)
+
+
+@unittest.skipIf(web is None, 'aiohttp not installed')
+class AsyncAPINameTest(unittest.IsolatedAsyncioTestCase):
+    """
+        AsyncAPIName tests against a local aiohttp server
+    """
+    async def asyncSetUp(self):
+        self.domain = 'test.com'
+        self.requests = []
+        self.records = [{'record_id': '1', 'name': 'www.test.com',
+            'type': 'A', 'content': '10.0.0.1', 'ttl': 300, 'priority': None}]
+
+        async def handler(request):
+            self.requests.append((request.method, request.path))
+            _action = request.path.split('/')[3]
+            if _action == 'list':
+                return web.json_response(_ok(records=self.records))
+            if _action == 'create':
+                _data = json.loads(await request.text())
+                return web.json_response(_ok(record_id='2',
+                    name=_data['hostname'] + '.test.com', type=_data['type'],
+                    content=_data['content'], ttl=_data['ttl'], priority=None))
+            if _action == 'get' and request.path.endswith('missing.com'):
+                return web.json_response({'result': {'code': 251,
+                    'message': 'Domain not found'}})
+            return web.json_response(_ok())
+
+        _app = web.Application()
+        _app.router.add_route('*', '/{tail:.*}', handler)
+        self.runner = web.AppRunner(_app)
+        await self.runner.setup()
+        _site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await _site.start()
+        _port = _site._server.sockets[0].getsockname()[1]
+        self.api = AsyncAPIName(url='http://127.0.0.1:%d/api' % _port,
+            username='foo', token='bar', concurrency=2)
+
+    async def asyncTearDown(self):
+        await self.api.close()
+        await self.runner.cleanup()
+
+    async def test_list_and_create(self):
+        "List and create dns records"
+        _records = await self.api.list_dns_records(self.domain)
+        self.assertEqual(_records.get('1').hostname, 'www.test.com')
+        _record = await self.api.create_dns_record(self.domain,
+            DNSRecord(self.domain, 'api', 'A', '10.0.0.2'))
+        self.assertEqual(_record.record_id, '2')
+        self.assertEqual(_record.content, '10.0.0.2')
+
+    async def test_update_and_domain(self):
+        "Update records, nameservers and check domains"
+        self.assertTrue(await self.api.update_dns_record(self.domain,
+            '10.0.0.1', DNSRecord(self.domain, 'www', 'A', '10.0.0.3')))
+        self.assertEqual([_p.split('/')[3] for _m, _p in self.requests],
+            ['list', 'delete', 'create'])
+        self.assertTrue(await self.api.update_nameservers(self.domain,
+            ['ns1.test.com']))
+        self.assertTrue(await self.api.get_domain(self.domain))
+        self.assertFalse(await self.api.get_domain('missing.com'))
+
+    async def test_concurrency_limit(self):
+        "Requests beyond the concurrency limit wait in the running loop"
+        _api = AsyncAPIName(url=self.api.base_url, username='foo',
+            token='bar', concurrency=1)
+        try:
+            _zones = await asyncio.gather(*[_api.list_dns_records(
+                self.domain) for _ in range(3)])
+        finally:
+            await _api.close()
+        self.assertEqual([len(_zone) for _zone in _zones], [1, 1, 1])
 
-    #TODO: tests
 
 if __name__ == '__main__':
     unittest.main()